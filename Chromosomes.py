@@ -10,39 +10,56 @@ class RoomChromosome:
         self.connected = connected
 
     @staticmethod
-    def generate(_rng, index, gene_length):
-        x = _rng.randrange(1, map_width - min_room_size - 2)
-        y = _rng.randrange(1, map_height - min_room_size - 2)
-        width = _rng.randrange(min_room_size, min(map_width - x, max_room_size + 1))
-        height = _rng.randrange(min_room_size, min(map_height - y, max_room_size + 1))
+    def generate(_rng, index, gene_length, config=default_config):
+        min_size, max_size = config.min_room_size, config.max_room_size
+        x = _rng.randrange(1, config.map_width - min_size - 2)
+        y = _rng.randrange(1, config.map_height - min_size - 2)
+        width = _rng.randrange(min_size, min(config.map_width - x, max_size + 1))
+        height = _rng.randrange(min_size, min(config.map_height - y, max_size + 1))
         rect = Rect(x, y, width, height)
         position = _rng.choice(["Over", "Under"])
         connected = _rng.choices([True, False], k=gene_length)
         return RoomChromosome(index, rect, position, connected)
 
+    # hashable value of the chromosome, equal for chromosomes that give the same room
+    def key(self):
+        return self.index, self.rect.x, self.rect.y, self.rect.w, self.rect.h, self.position, tuple(self.connected)
+
+    @staticmethod
+    def gene_key(gene):
+        return tuple(chromosome.key() for chromosome in gene)
+
     @staticmethod
-    def generate_gene(_rng, gene_length):
-        return [RoomChromosome.generate(_rng, i, gene_length) for i in range(gene_length)]
+    def generate_gene(_rng, gene_length, config=default_config):
+        return [RoomChromosome.generate(_rng, i, gene_length, config) for i in range(gene_length)]
 
     # Replaces random chromosome in a gene
     @staticmethod
-    def mutate(_rng, gene):
+    def mutate(_rng, gene, config=default_config):
         index = _rng.randrange(len(gene))
-        gene[index] = RoomChromosome.generate(_rng, index, len(gene))
+        gene[index] = RoomChromosome.generate(_rng, index, len(gene), config)
         return gene
 
 
 class RoomTypeChromosome:
+    types = ["Kitchen", "Bathroom", "Storage", "Hall", "Corridor"]
+
     def __init__(self, room, room_type):
         self.room = room
         self.room_type = room_type
 
     @staticmethod
     def generate(_rng, room):
-        types = ["Kitchen", "Bathroom", "Storage", "Hall", "Corridor"]
-        room_type = _rng.choice(types)
+        room_type = _rng.choice(RoomTypeChromosome.types)
         return RoomTypeChromosome(room, room_type)
 
+    def key(self):
+        return self.room.key(), self.room_type
+
+    @staticmethod
+    def gene_key(gene):
+        return tuple(chromosome.key() for chromosome in gene)
+
     @staticmethod
     def generate_gene(_rng, gene):
         return [RoomTypeChromosome.generate(_rng, room) for room in gene]
@@ -55,25 +72,44 @@ class RoomTypeChromosome:
 
 
 class EnemyChromosome:
+    types = ["fat", "dog", "dodger", "melee_static",
+             "melee_patrol", "melee_random", "uzi_static", "uzi_patrol",
+             "uzi_random", "9mm_static", "9mm_patrol", "9mm_random",
+             "shotgun_static", "shotgun_patrol", "shotgun_random"]
+
     def __init__(self, index, room_tiles, enemies):
         self.index = index
         self.room_tiles = room_tiles
         self.enemies = enemies
 
+    # a room left without free tiles gets no enemies
     @staticmethod
     def generate(_rng, index, room_tiles):
-        enemy_types = ["fat", "dog", "dodger", "melee_static",
-                       "melee_patrol", "melee_random", "uzi_static", "uzi_patrol",
-                       "uzi_random", "9mm_static", "9mm_patrol", "9mm_random",
-                       "shotgun_static", "shotgun_patrol", "shotgun_random"]
+        if not room_tiles:
+            return EnemyChromosome(index, room_tiles, [])
         tiles = _rng.sample(room_tiles, _rng.randrange(min(12, len(room_tiles))))
-        enemies = [(tile, _rng.choice(enemy_types)) for tile in tiles]
+        enemies = [(tile, _rng.choice(EnemyChromosome.types)) for tile in tiles]
         return EnemyChromosome(index, room_tiles, enemies)
 
+    # enemy_fitness only depends on the room's index and size and on the enemies
+    def key(self):
+        return self.index, len(self.room_tiles), tuple((tile.x, tile.y, enemy) for tile, enemy in self.enemies)
+
     @staticmethod
-    def generate_gene(_rng, rooms_tiles, rooms_by_distance, occ_tiles):
+    def gene_key(gene):
+        return tuple(chromosome.key() for chromosome in gene)
+
+    # Keeps the tiles of every room enemies can stand on. With the level's WallMap as walls the tiles next to
+    # doors and transitions are left free of enemies too
+    @staticmethod
+    def free_tiles(rooms_tiles, occ_tiles, walls=None):
         for room in rooms_tiles:
-            rooms_tiles[room] = [tile for tile in rooms_tiles[room] if tile not in occ_tiles]
+            rooms_tiles[room] = [tile for tile in rooms_tiles[room] if tile not in occ_tiles and
+                                 (walls is None or not walls.is_near_door((tile.x, tile.y)))]
+
+    @staticmethod
+    def generate_gene(_rng, rooms_tiles, rooms_by_distance, occ_tiles, walls=None):
+        EnemyChromosome.free_tiles(rooms_tiles, occ_tiles, walls)
         return [EnemyChromosome.generate(_rng, rooms_by_distance.index(room),
                                          rooms_tiles[room]) for room in rooms_tiles]
 
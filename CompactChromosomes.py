@@ -0,0 +1,182 @@
+from array import array
+
+from Chromosomes import RoomChromosome, RoomTypeChromosome, EnemyChromosome
+from Geometry import Point, Rect
+from config import *
+
+
+# Compact genes: flat arrays of small integers instead of lists of chromosome objects, cheap to copy, hash
+# and pickle. Their operators draw from the rng exactly like the operators of the object genes, so a run on
+# compact genes breeds the same genes as a run on the objects. encode and decode convert between both forms
+
+# Crossovers of the chromosome records, size numbers each, of two flat arrays, or of two lists of records
+def uniform_crossover(_rng, gene1, gene2, size=1):
+    if len(gene1) < len(gene2):
+        gene1, gene2 = gene2, gene1
+    gene = gene1[:0]
+    for i in range(0, len(gene2), size):
+        gene += (gene1, gene2)[_rng.choice((0, 1))][i:i + size]
+    for i in range(len(gene2), len(gene1), size):
+        if _rng.choice([True, False]):
+            gene += gene1[i:i + size]
+    return gene
+
+
+def one_point_crossover(_rng, gene1, gene2, size=1):
+    if len(gene1) < len(gene2):
+        gene1, gene2 = gene2, gene1
+    split_point = _rng.randrange(len(gene2) // size + 1) * size
+    return gene2[:split_point] + gene1[split_point:]
+
+
+# A room gene is an array('q') with a record per room: index, x, y, w, h, 1 for "Over" and 0 for "Under",
+# the number of connected flags and the flags as a bitmask with flag k in bit k
+class CompactRoomGene:
+    fields = 8
+    # the flags of a room have to fit in the positive values of a signed 64 bit record
+    max_rooms = 63
+
+    @staticmethod
+    def encode_chromosome(chromosome):
+        if len(chromosome.connected) > CompactRoomGene.max_rooms:
+            raise ValueError("compact room genes hold at most %d rooms, got %d" % (CompactRoomGene.max_rooms,
+                                                                                 len(chromosome.connected)))
+        rect = chromosome.rect
+        connected = sum(1 << k for k, flag in enumerate(chromosome.connected) if flag)
+        return [chromosome.index, rect.x, rect.y, rect.w, rect.h, chromosome.position == "Over",
+                len(chromosome.connected), connected]
+
+    @staticmethod
+    def encode(gene):
+        return array("q", [value for chromosome in gene for value in CompactRoomGene.encode_chromosome(chromosome)])
+
+    @staticmethod
+    def decode(compact):
+        gene = []
+        for i in range(0, len(compact), CompactRoomGene.fields):
+            index, x, y, w, h, over, flags, connected = compact[i:i + CompactRoomGene.fields]
+            gene.append(RoomChromosome(index, Rect(x, y, w, h), "Over" if over else "Under",
+                                       [bool(connected >> k & 1) for k in range(flags)]))
+        return gene
+
+    @staticmethod
+    def length(compact):
+        return len(compact) // CompactRoomGene.fields
+
+    @staticmethod
+    def key(compact):
+        return compact.tobytes()
+
+    @staticmethod
+    def generate_gene(_rng, gene_length, config=default_config):
+        return CompactRoomGene.encode(RoomChromosome.generate_gene(_rng, gene_length, config))
+
+    @staticmethod
+    def mutate(_rng, compact, config=default_config):
+        index = _rng.randrange(CompactRoomGene.length(compact))
+        start = index * CompactRoomGene.fields
+        chromosome = RoomChromosome.generate(_rng, index, CompactRoomGene.length(compact), config)
+        compact[start:start + CompactRoomGene.fields] = array("q", CompactRoomGene.encode_chromosome(chromosome))
+        return compact
+
+    @staticmethod
+    def uniform_crossover(_rng, gene1, gene2):
+        return uniform_crossover(_rng, gene1, gene2, CompactRoomGene.fields)
+
+    @staticmethod
+    def one_point_crossover(_rng, gene1, gene2):
+        return one_point_crossover(_rng, gene1, gene2, CompactRoomGene.fields)
+
+
+# A room type gene is an array('b') of indexes into RoomTypeChromosome.types, one per room of the room gene
+# it was generated for. The rooms are the same for the whole population, so they are only given to decode
+class CompactRoomTypeGene:
+    @staticmethod
+    def encode(gene):
+        return array("b", [RoomTypeChromosome.types.index(chromosome.room_type) for chromosome in gene])
+
+    @staticmethod
+    def decode(compact, rooms):
+        return [RoomTypeChromosome(room, RoomTypeChromosome.types[code]) for room, code in zip(rooms, compact)]
+
+    @staticmethod
+    def key(compact):
+        return compact.tobytes()
+
+    @staticmethod
+    def generate_gene(_rng, rooms):
+        return array("b", [_rng.choice(range(len(RoomTypeChromosome.types))) for _ in rooms])
+
+    @staticmethod
+    def mutate(_rng, compact):
+        index = _rng.randrange(len(compact))
+        compact[index] = _rng.choice(range(len(RoomTypeChromosome.types)))
+        return compact
+
+    @staticmethod
+    def uniform_crossover(_rng, gene1, gene2):
+        return uniform_crossover(_rng, gene1, gene2)
+
+    @staticmethod
+    def one_point_crossover(_rng, gene1, gene2):
+        return one_point_crossover(_rng, gene1, gene2)
+
+
+# An enemy gene is a list with an array('h') per room: the room's index in rooms_by_distance followed by
+# x, y and an index into EnemyChromosome.types for every enemy. The rooms' free tiles do not change during
+# a run, they are kept by index in the CompactEnemyGene. The crossovers treat the arrays as whole chromosomes
+class CompactEnemyGene:
+    def __init__(self, rooms_tiles):
+        self.rooms_tiles = rooms_tiles
+
+    @staticmethod
+    def encode_chromosome(chromosome):
+        values = [chromosome.index]
+        for tile, enemy in chromosome.enemies:
+            values += [tile.x, tile.y, EnemyChromosome.types.index(enemy)]
+        return array("h", values)
+
+    @staticmethod
+    def encode(gene):
+        return [CompactEnemyGene.encode_chromosome(chromosome) for chromosome in gene]
+
+    # The rooms_tiles of the chromosomes, by index
+    @staticmethod
+    def of(gene):
+        return CompactEnemyGene({chromosome.index: chromosome.room_tiles for chromosome in gene})
+
+    # The rooms of EnemyChromosome.generate_gene with the same arguments, their free tiles filtered the same way
+    @staticmethod
+    def for_rooms(rooms_tiles, rooms_by_distance, occ_tiles, walls=None):
+        EnemyChromosome.free_tiles(rooms_tiles, occ_tiles, walls)
+        return CompactEnemyGene({rooms_by_distance.index(room): tiles for room, tiles in rooms_tiles.items()})
+
+    def decode(self, compact):
+        gene = []
+        for values in compact:
+            enemies = [(Point(values[i], values[i + 1]), EnemyChromosome.types[values[i + 2]])
+                       for i in range(1, len(values), 3)]
+            gene.append(EnemyChromosome(values[0], self.rooms_tiles[values[0]], enemies))
+        return gene
+
+    @staticmethod
+    def key(compact):
+        return tuple(values.tobytes() for values in compact)
+
+    def generate_gene(self, _rng):
+        return [self.encode_chromosome(EnemyChromosome.generate(_rng, index, tiles))
+                for index, tiles in self.rooms_tiles.items()]
+
+    def mutate(self, _rng, compact):
+        index = _rng.randrange(len(compact))
+        room = compact[index][0]
+        compact[index] = self.encode_chromosome(EnemyChromosome.generate(_rng, room, self.rooms_tiles[room]))
+        return compact
+
+    @staticmethod
+    def uniform_crossover(_rng, gene1, gene2):
+        return uniform_crossover(_rng, gene1, gene2)
+
+    @staticmethod
+    def one_point_crossover(_rng, gene1, gene2):
+        return one_point_crossover(_rng, gene1, gene2)
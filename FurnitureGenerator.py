@@ -1,6 +1,63 @@
 from Geometry import Point
 
 
+# One room's tiles on a grid around its bounding box, for placing furniture. A summed-area table of the room's
+# tiles tells whether a footprint lies inside the room in O(1), and the tiles taken by placed objects are
+# marked on the grid in place, so the placement rules never search lists of tiles
+class OccupancyGrid:
+    # placed objects and their footprints reach at most this far out of the room
+    margin = 3
+
+    def __init__(self, tiles):
+        self.tiles = tiles
+        self.left = min(x for x, _ in tiles) - self.margin
+        self.top = min(y for _, y in tiles) - self.margin
+        self.width = max(x for x, _ in tiles) - self.left + 1 + self.margin
+        self.height = max(y for _, y in tiles) - self.top + 1 + self.margin
+        inside = bytearray(self.width * self.height)
+        for tile in tiles:
+            inside[self.index(tile)] = 1
+        # sums[(i + 1) * (height + 1) + j + 1] is the number of room tiles in columns 0..i and rows 0..j
+        stride = self.height + 1
+        self.sums = [0] * ((self.width + 1) * stride)
+        for i in range(self.width):
+            row = 0
+            for j in range(self.height):
+                row += inside[i * self.height + j]
+                self.sums[(i + 1) * stride + j + 1] = self.sums[i * stride + j + 1] + row
+        self.taken = bytearray(self.width * self.height)
+        self.candidates = {}
+
+    def index(self, tile):
+        return (tile[0] - self.left) * self.height + tile[1] - self.top
+
+    def on_grid(self, tile):
+        return 0 <= tile[0] - self.left < self.width and 0 <= tile[1] - self.top < self.height
+
+    # room tiles in the size x size square with its top left tile at (x, y), the square is on the grid
+    def room_tiles(self, x, y, size):
+        stride = self.height + 1
+        i, j = x - self.left, y - self.top
+        sums = self.sums
+        return (sums[(i + size) * stride + j + size] - sums[i * stride + j + size] -
+                sums[(i + size) * stride + j] + sums[i * stride + j])
+
+    # The room's tiles whose size x size footprint starting offset tiles up and left of them lies in the room,
+    # in the order of the room's tiles. Computed once per footprint
+    def fitting(self, offset, size):
+        if (offset, size) not in self.candidates:
+            self.candidates[(offset, size)] = [tile for tile in self.tiles if
+                                               self.room_tiles(tile[0] + offset, tile[1] + offset, size) == size * size]
+        return self.candidates[(offset, size)]
+
+    def is_free(self, tile):
+        return not self.on_grid(tile) or not self.taken[self.index(tile)]
+
+    def take(self, tile):
+        if self.on_grid(tile):
+            self.taken[self.index(tile)] = 1
+
+
 class FurnitureGenerator:
     # angle of rotation, and vector of direction
     angles = {
@@ -36,54 +93,42 @@ class FurnitureGenerator:
             ((3195, 1838), 1, 3, 1)
         ]
     }
+    # (offset, size) of the square a size 0 object's tile needs around it inside the room
+    center_footprint = (-3, 6)
 
+    # hotline_map is the level's WallMap
     @staticmethod
     def is_door_tile(hotline_map, tile):
-        for i in range(tile[0] - 1, tile[0] + 2):
-            for j in range(tile[1] - 1, tile[1] + 2):
-                for key, val in hotline_map[i][j].items():
-                    if val[0] == 'Door' or val[0] == 'Transition':
-                        return True
-        return False
+        return hotline_map.is_near_door(tile)
 
     # get wall tiles, but not near door
     # ind - show dimension of borders. 0 - vertical, 1 - horizontal
     # angles - shows 'direction' of wall
     @staticmethod
     def get_borders(hotline_map, arr, coord_index, directions):
+        near_door = hotline_map.near_door_mask()
+        height = hotline_map.height
         # sort by one of the dimensions
         arr = sorted(arr, key=lambda tile: tile[coord_index])
         # init array of borders
         borders = []
         prev = arr[0]
-        if not FurnitureGenerator.is_door_tile(hotline_map, prev):
+        if not near_door[prev[0] * height + prev[1]]:
             borders += [(prev, directions[0])]
         for tile in arr:
             if prev[coord_index] != tile[coord_index]:
-                if not FurnitureGenerator.is_door_tile(hotline_map, prev):
+                if not near_door[prev[0] * height + prev[1]]:
                     borders += [(prev, directions[1])]
-                if not FurnitureGenerator.is_door_tile(hotline_map, tile):
+                if not near_door[tile[0] * height + tile[1]]:
                     borders += [(tile, directions[0])]
             prev = tile
-        if not FurnitureGenerator.is_door_tile(hotline_map, prev):
+        if not near_door[prev[0] * height + prev[1]]:
             borders += [(prev, directions[1])]
         return borders
 
     @staticmethod
     def get_center_tiles(room_tiles):
-        result = []
-        for tile in room_tiles:
-            center = True
-            for x in range(-3, 3):
-                for y in range(-3, 3):
-                    if (tile[0] + x, tile[1] + y) not in room_tiles:
-                        center = False
-                        break
-                if not center:
-                    break
-            if center:
-                result += [tile]
-        return result
+        return OccupancyGrid(room_tiles).fitting(*FurnitureGenerator.center_footprint)
 
     @staticmethod
     def split_walls_corners(a, b):
@@ -95,49 +140,51 @@ class FurnitureGenerator:
         b_no = [x for x in b if x[0] not in corners]
         return a_no, b_no, corner_tiles
 
+    # The objects' lines are appended to out, EnemySerializer writes them to the .obj file with the enemies
     @staticmethod
-    def place_objects(rng, hotline_map, rooms_types, rooms_tiles, path):
+    def place_objects(rng, hotline_map, rooms_types, rooms_tiles, out):
         occupied_tiles = []
-        with open(path, "w") as f:
-            for room, tiles in rooms_tiles.items():
-                if rooms_types[room] == "Corridor":
-                    continue
-                tiles_tuples = [(tile.x, tile.y) for tile in tiles]
-
-                center_tiles = FurnitureGenerator.get_center_tiles(tiles_tuples)
-                borders_x = FurnitureGenerator.get_borders(hotline_map, tiles_tuples, 0, ("right", "left"))
-                borders_y = FurnitureGenerator.get_borders(hotline_map, tiles_tuples, 1, ("up", "down"))
-                walls_x, walls_y, corners = FurnitureGenerator.split_walls_corners(borders_x, borders_y)
-                borders = walls_x + walls_y
-
-                occupied_tiles += FurnitureGenerator.place_objects2(f, rng, borders, center_tiles,
-                                                                    FurnitureGenerator.objects[rooms_types[room]])
-
-                # if center_tiles and rng.randrange(10) < 6:
-                #     occupied_tiles += FurnitureGenerator.place_billiard(rng, center_tiles, f)
-                # if corners and rng.randrange(10) < 4:
-                #     occupied_tiles += FurnitureGenerator.place_tv_spot(rng, walls + corners, f, tiles_tuples)
-                # if walls and rng.randrange(10) < 8:
-                #     occupied_tiles += FurnitureGenerator.place_bookshelf(rng, walls, f)
+        for room, tiles in rooms_tiles.items():
+            if rooms_types[room] == "Corridor" or not tiles:
+                continue
+            tiles_tuples = [(tile.x, tile.y) for tile in tiles]
+
+            grid = OccupancyGrid(tiles_tuples)
+            borders_x = FurnitureGenerator.get_borders(hotline_map, tiles_tuples, 0, ("right", "left"))
+            borders_y = FurnitureGenerator.get_borders(hotline_map, tiles_tuples, 1, ("up", "down"))
+            walls_x, walls_y, corners = FurnitureGenerator.split_walls_corners(borders_x, borders_y)
+            borders = walls_x + walls_y
+
+            occupied_tiles += FurnitureGenerator.place_objects2(out, rng, borders, grid,
+                                                                FurnitureGenerator.objects[rooms_types[room]])
+
+            # if center_tiles and rng.randrange(10) < 6:
+            #     occupied_tiles += FurnitureGenerator.place_billiard(rng, center_tiles, out)
+            # if corners and rng.randrange(10) < 4:
+            #     occupied_tiles += FurnitureGenerator.place_tv_spot(rng, walls + corners, out, tiles_tuples)
+            # if walls and rng.randrange(10) < 8:
+            #     occupied_tiles += FurnitureGenerator.place_bookshelf(rng, walls, out)
 
         return occupied_tiles
 
+    # Places the objects in order: size 0 objects on a tile with room around it, the others along the walls.
+    # Tiles around a placed object are taken on the grid too, later objects are not put on them
     @staticmethod
-    def place_objects2(f, rng, borders, center_tiles, objects):
+    def place_objects2(out, rng, borders, grid, objects):
         occupied_tiles = []
-        extra_occupied = []
         for obj in objects:
-            borders = [border for border in borders if
-                       border[0] not in occupied_tiles and border[0] not in extra_occupied]
+            borders = [border for border in borders if grid.is_free(border[0])]
             obj_type, obj_rotated, obj_size, obj_variations = obj
             if obj_size == 0:
+                center_tiles = grid.fitting(*FurnitureGenerator.center_footprint)
                 if center_tiles:
                     x, y = rng.choice(center_tiles)
-                    FurnitureGenerator.write(f, x, y, obj_type, 90 * rng.randrange(2), rng.randrange(obj_variations))
+                    FurnitureGenerator.write(out, x, y, obj_type, 90 * rng.randrange(2), rng.randrange(obj_variations))
                     occupied_tiles.append((x, y))
                     for i in range(3):
                         for j in range(3):
                             occupied_tiles.append((x + i - 1, y + j - 1))
+                            grid.take((x + i - 1, y + j - 1))
             else:
                 if borders:
                     border = rng.choice(borders)
@@ -149,32 +196,33 @@ class FurnitureGenerator:
                     if obj_size > 1:
                         extra_tile_1 = (x + x_dir, y + y_dir)
                         extra_tile_2 = (x - x_dir, y - y_dir)
-                        if extra_tile_1 in occupied_tiles or extra_tile_2 in occupied_tiles:
-                            continue
-                        if extra_tile_1 in extra_occupied or extra_tile_2 in extra_occupied:
+                        if not grid.is_free(extra_tile_1) or not grid.is_free(extra_tile_2):
                             continue
                         occupied_tiles.append(extra_tile_1)
                         occupied_tiles.append(extra_tile_2)
-                        extra_occupied.append((x + x_dir2 + x_dir * multiplier, y + y_dir2 + y_dir * multiplier))
-                        extra_occupied.append((x + x_dir2 - x_dir * multiplier, y + y_dir2 - y_dir * multiplier))
+                        grid.take(extra_tile_1)
+                        grid.take(extra_tile_2)
+                        grid.take((x + x_dir2 + x_dir * multiplier, y + y_dir2 + y_dir * multiplier))
+                        grid.take((x + x_dir2 - x_dir * multiplier, y + y_dir2 - y_dir * multiplier))
                         multiplier = 2
-                    extra_occupied.append((x + x_dir2, y + y_dir2))
-                    extra_occupied.append((x + x_dir2 + x_dir * multiplier, y + y_dir2 + y_dir * multiplier))
-                    extra_occupied.append((x + x_dir2 - x_dir * multiplier, y + y_dir2 - y_dir * multiplier))
+                    grid.take((x + x_dir2, y + y_dir2))
+                    grid.take((x + x_dir2 + x_dir * multiplier, y + y_dir2 + y_dir * multiplier))
+                    grid.take((x + x_dir2 - x_dir * multiplier, y + y_dir2 - y_dir * multiplier))
                     occupied_tiles += [(x, y)]
-                    FurnitureGenerator.write(f, x, y, obj_type,
+                    grid.take((x, y))
+                    FurnitureGenerator.write(out, x, y, obj_type,
                                              FurnitureGenerator.angles[angle]['angle'] - 90 * obj_rotated,
                                              rng.randrange(obj_variations))
         return [Point(tile[0], tile[1]) for tile in occupied_tiles]
 
     @staticmethod
-    def place_bookshelf(rng, all_borders, f):
+    def place_bookshelf(rng, all_borders, out):
         border = rng.choice(all_borders)
         x, y = border[0]
         angle = border[1]
         x_dir, y_dir = FurnitureGenerator.angles[angle]['direction']
         bookshelf_types = [(3303, 1901), (171, 98)]
-        FurnitureGenerator.write(f, x, y, rng.choice(bookshelf_types),
+        FurnitureGenerator.write(out, x, y, rng.choice(bookshelf_types),
                                  FurnitureGenerator.angles[angle]['angle'] - 90)
 
         new_occupations = []
@@ -184,7 +232,7 @@ class FurnitureGenerator:
         return new_occupations
 
     @staticmethod
-    def place_tv_spot(rng, all_borders, f, tiles_tuples):
+    def place_tv_spot(rng, all_borders, out, tiles_tuples):
         border = rng.choice(all_borders)
         x, y = border[0]
         angle = border[1]
@@ -192,9 +240,9 @@ class FurnitureGenerator:
         armchair_types = [(178, 104), (1355, 835), (3450, 2013)]
         if (x + x_dir * 2, y + y_dir * 2) not in tiles_tuples or (x + x_dir * 3, y + y_dir * 3) not in tiles_tuples:
             return []
-        FurnitureGenerator.write(f, x, y, (191, 110),
+        FurnitureGenerator.write(out, x, y, (191, 110),
                                  FurnitureGenerator.angles[angle]['angle'])
-        FurnitureGenerator.write(f, x + x_dir, y + y_dir, rng.choice(armchair_types),
+        FurnitureGenerator.write(out, x + x_dir, y + y_dir, rng.choice(armchair_types),
                                  FurnitureGenerator.angles[angle]['angle'] + 90)
 
         new_occupations = []
@@ -203,10 +251,10 @@ class FurnitureGenerator:
         return new_occupations
 
     @staticmethod
-    def place_billiard(rng, center_tiles, f):
+    def place_billiard(rng, center_tiles, out):
         x, y = rng.choice(center_tiles)
         is_rotated = rng.randrange(2)
-        FurnitureGenerator.write(f, x, y, (1861, 1092), 90 * is_rotated)
+        FurnitureGenerator.write(out, x, y, (1861, 1092), 90 * is_rotated)
 
         new_occupations = []
         new_occupations += [Point(x, y)]
@@ -220,11 +268,6 @@ class FurnitureGenerator:
         return new_occupations
 
     @staticmethod
-    def write(f, x, y, object_type, rotation=0, variant=0):
-        print(11, file=f)
-        print(32 * x + 20, file=f)
-        print(32 * y + 20, file=f)
-        print(object_type[0], file=f)
-        print(rotation, file=f)
-        print(object_type[1], file=f)
-        print(variant, file=f)
+    def write(out, x, y, object_type, rotation=0, variant=0):
+        out.append("11\n%d\n%d\n%d\n%d\n%d\n%d\n" % (32 * x + 20, 32 * y + 20, object_type[0], rotation,
+                                                      object_type[1], variant))
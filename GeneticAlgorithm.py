@@ -1,51 +1,272 @@
-import tkinter as tk
+import os
+import pickle
+import random
+import time
+from collections import OrderedDict
 from math import exp, pow, log, e
 
-from Room import RoomMap, RoomsGraph
-from Visualiser import Application
+from Layout import LayoutAnalysis
+from Room import RoomMapHistory
+from Selection import make_strategy
 from config import *
 
 
+# Executor used to evaluate a generation: "serial" (None), "thread" or "process". Fitness functions and
+# genes are sent to process workers by pickle, so they have to be module level functions and plain objects.
+# concurrent.futures is only imported when a pool is made, it is most of the import time of the module
+def make_executor(kind, workers=None):
+    if kind == "serial":
+        return None
+    if kind == "thread":
+        from concurrent.futures import ThreadPoolExecutor
+        return ThreadPoolExecutor(workers)
+    if kind == "process":
+        from concurrent.futures import ProcessPoolExecutor
+        return ProcessPoolExecutor(workers)
+    raise ValueError("Unknown executor: %s" % kind)
+
+
+# Remembers the fitness of the last evaluated genes by a hashable key, key must give equal keys only to
+# genes with the same fitness. It keeps config.fitness_cache_size values
+class FitnessCache:
+    def __init__(self, key, config=default_config):
+        self.key = key
+        self.size = config.fitness_cache_size
+        self.values = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def evaluate(self, fitness, gene):
+        return self.evaluate_all(fitness, [gene])[0]
+
+    # Only the genes with unknown keys are given to map_, each key once
+    def evaluate_all(self, fitness, genes, map_=map):
+        keys = [self.key(gene) for gene in genes]
+        values = {key: self.values[key] for key in keys if key in self.values}
+        missing = {key: gene for key, gene in zip(keys, genes) if key not in values}
+        values.update(zip(missing, map_(fitness, list(missing.values()))))
+        for key in keys:
+            if key in self.values:
+                self.hits += 1
+                self.values.move_to_end(key)
+                continue
+            self.misses += 1
+            self.values[key] = values[key]
+            if len(self.values) > self.size:
+                self.values.popitem(last=False)
+        return [values[key] for key in keys]
+
+
+# Calls callback(generation, steps, population) with the sorted population of a generation, at most once
+# every `every` generations and once every `interval` ms. The last generation is always reported
+class Observer:
+    def __init__(self, callback, every=1, interval=0):
+        self.callback = callback
+        self.every = every
+        self.interval = interval
+        self.last_generation = None
+        self.last_time = None
+
+    def reset(self):
+        self.last_generation = None
+        self.last_time = None
+
+    def notify(self, generation, steps, population):
+        now = time.monotonic()
+        if generation < steps and self.last_generation is not None:
+            if generation - self.last_generation < self.every or (now - self.last_time) * 1000 < self.interval:
+                return
+        self.last_generation, self.last_time = generation, now
+        self.callback(generation, steps, population)
+
+
+# Observer callback logging the fitness of a generation
+def print_progress(generation, steps, population):
+    print("%02d/%d" % (generation, steps), end=" ")
+    print(["{0:0.2f}".format(x[1]) for x in population])
+
+
+# Ends a GA early: at the deadline, a time.monotonic() value, after plateau generations without a better
+# best fitness or once the best fitness reaches target. The time of the next generations is estimated from
+# the last ones, so a GA stops before it would overrun the deadline
+class StopCondition:
+    def __init__(self, deadline=None, plateau=None, target=None):
+        self.deadline = deadline
+        self.plateau = plateau
+        self.target = target
+        self.best = None
+        self.improved = 0
+        self.generation_time = 0
+
+    def update(self, generation, fitness):
+        if self.best is None or fitness > self.best:
+            self.best = fitness
+            self.improved = generation
+
+    # how many of the next generations can still run
+    def allowed(self, generation, generations):
+        if self.plateau is not None and generation - self.improved >= self.plateau:
+            return 0
+        if self.target is not None and self.best >= self.target:
+            return 0
+        if self.deadline is None:
+            return generations
+        left = self.deadline - time.monotonic()
+        if left <= 0:
+            return 0
+        if self.generation_time:
+            generations = min(generations, int(left / self.generation_time))
+        return generations
+
+    def timed(self, started, generations):
+        self.generation_time = (time.monotonic() - started) / generations
+
+
+# Splits a time budget in seconds across the stages of a level by their shares. Each stage gets its share of
+# the time that is left when it starts, so the time saved by a stage that stops early goes to the later ones.
+# Without a budget there are no deadlines
+class DeadlineScheduler:
+    def __init__(self, budget, shares):
+        self.end = None if budget is None else time.monotonic() + budget
+        self.shares = list(shares)
+
+    def next_deadline(self):
+        share = self.shares.pop(0)
+        if self.end is None:
+            return None
+        now = time.monotonic()
+        return now + max(0, self.end - now) * share / (share + sum(self.shares))
+
+
+# Checkpoints are pickled to a temporary file that then replaces the old checkpoint, so the file on disk is
+# always a complete checkpoint even if the process dies while writing
+def save_checkpoint(path, state):
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as file:
+        pickle.dump(state, file, pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary, path)
+
+
+def load_checkpoint(path):
+    with open(path, "rb") as file:
+        return pickle.load(file)
+
+
+# The checkpoint interval, the default strategy and the debug output come from config
 class GeneticAlgorithm:
-    def __init__(self, mutator, breeder, fitness, initial, _rng):
+    def __init__(self, mutator, breeder, fitness, initial, _rng, cache=None, executor=None, checkpoint=None,
+                 strategy=None, config=default_config):
         self.mutator = mutator
         self.breeder = breeder
         self.fitness = fitness
         self.initial = initial
         self._rng = _rng
+        self.cache = cache
+        self.executor = executor
+        self.checkpoint = checkpoint
+        self.checkpoint_interval = config.checkpoint_interval
+        self.fingerprint = config.fingerprint()
+        self.strategy = strategy or make_strategy(config)
+        self.debug_output = config.debug_output
+        self.observers = []
+        self.generations = 0
+        self.evaluations = 0
         self._population = None
 
-    def compute(self, steps):
-        self._population = [(x, self.fitness(x)) for x in self.initial]
+    # Registers a progress callback, rate limited to every `every` generations and `interval` ms
+    def observe(self, callback, every=1, interval=0):
+        observer = Observer(callback, every, interval)
+        self.observers.append(observer)
+        return observer
 
-        if self.fitness == Fitness.mixed_room_fitness:
-            app = Application(master=tk.Tk())
+    def notify(self, generation, steps):
+        for observer in self.observers:
+            observer.notify(generation, steps, self._population)
 
-        for i in range(steps):
-            self.sort_by_fitness()
+    # Fitness of a whole generation, in parallel if there is an executor. It never draws from the rng, so the
+    # result does not depend on how it is evaluated
+    def evaluate_all(self, genes):
+        self.evaluations += len(genes)
+        map_ = map if self.executor is None else self.executor_map
+        if self.cache is None:
+            return list(map_(self.fitness, genes))
+        return self.cache.evaluate_all(self.fitness, genes, map_)
+
+    # The genes go to the executor in a chunk per core, a task per gene costs more than most fitness calls
+    def executor_map(self, fitness, genes):
+        return self.executor.map(fitness, genes, chunksize=max(1, -(-len(genes) // (os.cpu_count() or 1))))
+
+    # Runs at most steps generations and returns the best gene, see StopCondition for the early stops.
+    # With a checkpoint path the state is saved every checkpoint_interval generations and at the end
+    def compute(self, steps, deadline=None, plateau=None, target=None):
+        self._population = list(zip(self.initial, self.evaluate_all(self.initial)))
+        return self.run(0, steps, StopCondition(deadline, plateau, target))
 
-            if debug_output:
-                print("%02d/%d" % (i, steps), end=" ")
-                print(["{0:0.2f}".format(x[1]) for x in self._population])
+    # Continues the compute saved in the checkpoint, giving the same result as an uninterrupted compute.
+    # The rng is restored too, so code that shares it with the GA also continues the same way. A checkpoint
+    # saved with another config is refused
+    def resume(self, steps, deadline=None, plateau=None, target=None):
+        state = load_checkpoint(self.checkpoint)
+        if state.get("config") != self.fingerprint:
+            raise ValueError("checkpoint %s was saved with another config" % self.checkpoint)
+        self._population = state["population"]
+        self._rng.setstate(state["rng"])
+        stop = StopCondition(deadline, plateau, target)
+        stop.best, stop.improved = state["best"], state["improved"]
+        return self.run(state["generation"], steps, stop)
 
-            if self.fitness == Fitness.mixed_room_fitness:
-                app.draw(self._population[0][0])
-                app.update()
+    def run(self, generation, steps, stop):
+        for observer in self.observers:
+            observer.reset()
 
+        while generation < steps:
+            self.sort_by_fitness()
+            stop.update(generation, self._population[0][1])
+            if not stop.allowed(generation, 1):
+                break
+            if self.checkpoint is not None and generation % self.checkpoint_interval == 0:
+                self.save(generation, stop)
+            self.notify(generation, steps)
+            started = time.monotonic()
             self.step()
-        if self.fitness == Fitness.mixed_room_fitness:
-            app.master.destroy()
+            stop.timed(started, 1)
+            generation += 1
         self.sort_by_fitness()
+        self.generations = generation
+        if self.checkpoint is not None:
+            self.save(generation, stop)
+        self.notify(generation, generation)
+        if self.debug_output and self.cache is not None:
+            print("fitness cache: %d hits, %d misses" % (self.cache.hits, self.cache.misses))
         return self._population[0][0]
 
+    # (gene, fitness) of the best individual
+    def best(self):
+        return self._population[0]
+
+    def save(self, generation, stop):
+        save_checkpoint(self.checkpoint, {"generation": generation, "population": self._population,
+                                          "rng": self._rng.getstate(), "best": stop.best,
+                                          "improved": stop.improved, "config": self.fingerprint})
+
+    # Continues from an evaluated population without notifying the observers, used by the islands
+    def evolve(self, population, steps):
+        self._population = population
+        for _ in range(steps):
+            self.sort_by_fitness()
+            self.step()
+        self.sort_by_fitness()
+        return self._population
+
     def sort_by_fitness(self):
-        self._population = sorted(self._population, key=lambda x: (-x[1]))
+        self._population = self.strategy.sort(self._population)
 
+    # One generation of the strategy, children are bred and mutated before they are evaluated
     def step(self):
-        for i in range(2, len(self._population)):
-            new_gene = self.breeder(self._rng, self._population[0][0], self._population[1][0])
-            mutated_gene = self.mutator(self._rng, new_gene)
-            self._population[i] = (mutated_gene, self.fitness(mutated_gene))
+        self._population = self.strategy.step(self._population, self.breed, self.evaluate_all, self._rng)
+
+    def breed(self, gene1, gene2):
+        return self.mutator(self._rng, self.breeder(self._rng, gene1, gene2))
 
     # Randomly mixes two genes
     @staticmethod
@@ -70,18 +291,134 @@ class GeneticAlgorithm:
         return gene
 
 
+# Runs one island for some generations, module level so process workers can unpickle it
+def evolve_island(mutator, breeder, fitness, strategy, population, _rng, steps, config):
+    ga = GeneticAlgorithm(mutator, breeder, fitness, [], _rng, strategy=strategy, config=config)
+    return ga.evolve(population, steps), ga.evaluations, _rng
+
+
+# Island model: several populations evolve independently, each with its own rng seeded from _rng, and
+# every migration_interval generations the best individuals of each island replace the worst ones of the
+# next island. Islands run on the executor's workers, all the rng draws of an island happen in its own
+# stream and the migrations happen here, so the result does not depend on the number of workers.
+# initial is called with an island's rng and returns its initial population. The number of islands, the
+# migrations and the default strategy come from config
+class IslandGeneticAlgorithm:
+    def __init__(self, mutator, breeder, fitness, initial, _rng, executor=None, strategy=None, config=default_config):
+        self.mutator = mutator
+        self.breeder = breeder
+        self.fitness = fitness
+        self.initial = initial
+        self._rng = _rng
+        self.islands = config.islands_number
+        self.migration_interval = config.migration_interval
+        self.migrants = config.migrants_number
+        self.executor = executor
+        self.strategy = strategy or make_strategy(config)
+        self.config = config
+        self.observers = []
+        self.generations = 0
+        self.evaluations = 0
+        self._populations = None
+
+    def observe(self, callback, every=1, interval=0):
+        observer = Observer(callback, every, interval)
+        self.observers.append(observer)
+        return observer
+
+    # observers see the individuals of all islands, sorted by fitness
+    def notify(self, generation, steps):
+        population = sorted((x for population in self._populations for x in population), key=lambda x: (-x[1]))
+        for observer in self.observers:
+            observer.notify(generation, steps, population)
+
+    def compute(self, steps, deadline=None, plateau=None, target=None):
+        rngs = [random.Random(self._rng.getrandbits(64)) for _ in range(self.islands)]
+        self._populations = []
+        for island_rng in rngs:
+            ga = GeneticAlgorithm(self.mutator, self.breeder, self.fitness, self.initial(island_rng), island_rng,
+                                  strategy=self.strategy, config=self.config)
+            self._populations.append(ga.evolve(list(zip(ga.initial, ga.evaluate_all(ga.initial))), 0))
+            self.evaluations += ga.evaluations
+        for observer in self.observers:
+            observer.reset()
+
+        stop = StopCondition(deadline, plateau, target)
+        done = 0
+        while done < steps:
+            stop.update(done, max(population[0][1] for population in self._populations))
+            generations = stop.allowed(done, min(self.migration_interval, steps - done))
+            if not generations:
+                break
+            if done:
+                self.migrate()
+            self.notify(done, steps)
+            started = time.monotonic()
+            arguments = [(self.mutator, self.breeder, self.fitness, self.strategy, population, island_rng, generations,
+                          self.config)
+                         for population, island_rng in zip(self._populations, rngs)]
+            if self.executor is None:
+                results = [evolve_island(*args) for args in arguments]
+            else:
+                results = list(self.executor.map(evolve_island, *zip(*arguments)))
+            self._populations = [population for population, _, _ in results]
+            self.evaluations += sum(evaluations for _, evaluations, _ in results)
+            rngs = [island_rng for _, _, island_rng in results]
+            stop.timed(started, generations)
+            done += generations
+        self.generations = done
+        self.notify(done, done)
+
+        return self.best()[0]
+
+    # (gene, fitness) of the best individual of all islands, the first island's on ties
+    def best(self):
+        best = max(range(self.islands), key=lambda i: (self._populations[i][0][1], -i))
+        return self._populations[best][0]
+
+    # the best individuals of every island replace the worst ones of the next island, populations are sorted
+    def migrate(self):
+        emigrants = [population[:self.migrants] for population in self._populations]
+        for i, population in enumerate(self._populations):
+            arriving = emigrants[i - 1]
+            population[len(population) - len(arriving):] = arriving
+
+
+# The fitness functions take the level's config as a keyword, the GAs get them bound with functools.partial
 class Fitness:
+    # children share most chromosomes with the evaluated parents, their maps are derived from the parents' maps.
+    # One history per map size
+    histories = {}
+
     @staticmethod
-    def mixed_room_fitness(gene):
-        room_map = RoomMap(gene)
-        rooms = room_map.get_room_number()
+    def room_maps(config=default_config):
+        size = (config.map_width, config.map_height)
+        if size not in Fitness.histories:
+            Fitness.histories.setdefault(size, RoomMapHistory(2 * config.population_size, config))
+        return Fitness.histories[size]
+
+    @staticmethod
+    def layout(gene, config=default_config):
+        if config.room_map_engine == "array":
+            return LayoutAnalysis.of(Fitness.room_maps(config).build(gene))
+        return LayoutAnalysis(gene, config=config)
+
+    # mixed_room_fitness only depends on the rooms the map accepts
+    @staticmethod
+    def room_layout_key(gene, config=default_config):
+        return tuple(room.key() for room in Fitness.layout(gene, config).room_map.rooms)
+
+    @staticmethod
+    def mixed_room_fitness(gene, config=default_config):
+        layout = Fitness.layout(gene, config)
+        rooms = layout.room_map.get_room_number()
         if rooms == 1:
             return -1000
-        narrow_corridors = len(room_map.get_narrow_corridors())
-        tiny_rooms = len(room_map.get_tiny_corridors())
-        building_area = room_map.get_building_area()
-        holes = len(room_map.get_holes())
-        graph = RoomsGraph(gene)
+        return Fitness.room_score(rooms, layout.narrow_corridors_number, layout.tiny_corridors_number,
+                                  layout.building_area, layout.holes_number, layout.graph)
+
+    @staticmethod
+    def room_score(rooms, narrow_corridors, tiny_rooms, building_area, holes, graph):
         if not graph.connected():
             return -1000
         avg_degree = graph.average_degree()
@@ -95,10 +432,10 @@ class Fitness:
                 building_area / 25.0 - 100 * holes)
 
     @staticmethod
-    def room_type_fitness(gene):
-        rooms_gene = [rtc.room for rtc in gene]
-        rooms_area = RoomMap(rooms_gene).get_rooms_area()
-        graph = RoomsGraph(rooms_gene)
+    def room_type_fitness(gene, config=default_config):
+        layout = Fitness.layout([rtc.room for rtc in gene], config)
+        rooms_area = layout.rooms_area
+        graph = layout.graph
         fitness = 0
         for key in graph.AdjMatrix:
             connected_rooms_types = [gene[i].room_type for i in graph.AdjMatrix[key]]
@@ -141,7 +478,7 @@ class Fitness:
         return fitness
 
     @staticmethod
-    def enemy_fitness(gene):
+    def enemy_fitness(gene, config=default_config):
         enemy_types_weights = {
             "fat": 100,
             "dog": 40,
@@ -166,7 +503,7 @@ class Fitness:
             for enemy in chromosome.enemies:
                 room_difficulty += enemy_types_weights[enemy[1]]
 
-            room_set_difficulty = difficulty * (len(chromosome.room_tiles) / average_room_area) * log(
+            room_set_difficulty = config.difficulty * (len(chromosome.room_tiles) / config.average_room_area) * log(
                 chromosome.index + 4, 4)
             fitness -= abs(room_set_difficulty - room_difficulty)
         return fitness
@@ -30,6 +30,10 @@ class Rect:
         self.w = width
         self.h = height
 
+    def intersects(self, rect):
+        return (self.x < rect.x + rect.w and rect.x < self.x + self.w and
+                self.y < rect.y + rect.h and rect.y < self.y + self.h)
+
     def crosses(self, rect):
         return (
             (rect.x < self.x and self.x + self.w < rect.x + rect.w and
@@ -37,3 +41,32 @@ class Rect:
             (rect.x <= self.x and self.x + self.w <= rect.x + rect.w and
              self.y < rect.y and rect.y + rect.h < self.y + self.h)
         )
+
+
+# Buckets rectangles by the cells of a coarse grid, so finding the rectangles that intersect a given one
+# does not scan all of them
+class RectIndex:
+    def __init__(self, cell_size=8):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.rects = {}
+
+    def cells_of(self, rect):
+        size = self.cell_size
+        for cx in range(rect.x // size, (rect.x + rect.w - 1) // size + 1):
+            for cy in range(rect.y // size, (rect.y + rect.h - 1) // size + 1):
+                yield cx, cy
+
+    def insert(self, key, rect):
+        self.rects[key] = (len(self.rects), rect)
+        for cell in self.cells_of(rect):
+            self.cells.setdefault(cell, []).append(key)
+
+    # keys of the inserted rectangles that intersect rect, in insertion order
+    def query(self, rect):
+        found = set()
+        for cell in self.cells_of(rect):
+            for key in self.cells.get(cell, ()):
+                if key not in found and self.rects[key][1].intersects(rect):
+                    found.add(key)
+        return sorted(found, key=lambda key: self.rects[key][0])
@@ -0,0 +1,69 @@
+from functools import cached_property
+
+from Geometry import Point
+from RectLayout import RectRoomMap
+from Room import ArrayRoomMap, RoomMap
+from config import *
+
+room_map_engines = {"list": RoomMap, "array": ArrayRoomMap, "rect": RectRoomMap}
+
+
+# Everything derived from one room layout, each part is computed on first access and then shared by the
+# fitness functions, the serializers and the visualiser
+class LayoutAnalysis:
+    def __init__(self, gene, room_map=None, config=default_config):
+        self.gene = gene
+        if room_map is None:
+            room_map = room_map_engines[config.room_map_engine](gene, config)
+        self.room_map = room_map
+
+    # the analysis cached on a map, so the maps kept by a RoomMapHistory keep theirs too
+    @staticmethod
+    def of(room_map):
+        if room_map.layout is None:
+            room_map.layout = LayoutAnalysis(room_map.gene, room_map, room_map.config)
+        return room_map.layout
+
+    @cached_property
+    def rooms_tiles(self):
+        return self.room_map.get_rooms_tiles()
+
+    @cached_property
+    def rooms_area(self):
+        return {room: len(tiles) for room, tiles in self.rooms_tiles.items()}
+
+    @cached_property
+    def building_area(self):
+        return self.room_map.get_building_area()
+
+    @cached_property
+    def rooms_centers(self):
+        return {room: Point.points_center(tiles) for room, tiles in self.rooms_tiles.items()}
+
+    @cached_property
+    def narrow_corridors(self):
+        return self.room_map.get_narrow_corridors()
+
+    @cached_property
+    def tiny_corridors(self):
+        return self.room_map.get_tiny_corridors()
+
+    @cached_property
+    def narrow_corridors_number(self):
+        return self.room_map.count_narrow_corridors()
+
+    @cached_property
+    def tiny_corridors_number(self):
+        return self.room_map.count_tiny_corridors()
+
+    @cached_property
+    def holes(self):
+        return self.room_map.get_holes()
+
+    @cached_property
+    def holes_number(self):
+        return self.room_map.count_holes()
+
+    @cached_property
+    def graph(self):
+        return self.room_map.get_graph()
@@ -0,0 +1,212 @@
+import io
+import random
+import time
+from functools import partial
+
+from Chromosomes import *
+from FurnitureGenerator import *
+from GeneticAlgorithm import *
+from Layout import LayoutAnalysis
+from Serializer import *
+from Telemetry import open_telemetry
+from config import *
+
+stages = ("rooms", "room_types", "enemies")
+file_names = ("level0.wll", "level0.tls", "level0.obj")
+
+
+# The config's fingerprint is in the name, a run with another config starts over instead of resuming
+def checkpoint_path(seed, stage, config=default_config):
+    if config.checkpoint_folder is None:
+        return None
+    return os.path.join(config.checkpoint_folder, "%d_%s_%s.ckpt" % (seed, stage, config.fingerprint()))
+
+
+# Called once the level's files are written
+def remove_checkpoints(seed, config=default_config):
+    for stage in stages:
+        if config.checkpoint_folder is not None and os.path.isfile(checkpoint_path(seed, stage, config)):
+            os.remove(checkpoint_path(seed, stage, config))
+
+
+# Resumes the GA if an interrupted run left a checkpoint of it
+def run_stage(ga, steps, deadline, plateau):
+    if ga.checkpoint is not None and os.path.isfile(ga.checkpoint):
+        return ga.resume(steps, deadline, plateau)
+    return ga.compute(steps, deadline, plateau)
+
+
+# Everything a level is made of, with the time every stage took and the fitness of the GAs' results
+class Level:
+    def __init__(self, seed, path):
+        self.seed = seed
+        self.path = path
+        self.rooms = None
+        self.room_types = None
+        self.layout = None
+        self.hotline_map = None
+        self.occupied_tiles = None
+        self.enemies = None
+        self.timings = {}
+        self.fitness = {}
+        self.generations = {}
+        self.files = None
+        self.started = time.perf_counter()
+
+    def timed(self, stage):
+        now = time.perf_counter()
+        self.timings[stage] = now - self.started - sum(self.timings.values())
+
+    # plain values for the manifest of a batch
+    def report(self):
+        return {"seed": self.seed, "path": self.path, "timings": dict(self.timings, total=sum(self.timings.values())),
+                "fitness": self.fitness, "generations": self.generations}
+
+
+# The whole pipeline for one seed: rooms, room types, furniture and enemies, written to level0.wll, level0.tls
+# and level0.obj in path. room_observers are (callback, every, interval) registered on the room GA. The files
+# are kept in memory and only written once the level is complete, so an interrupted run leaves no partial
+# level behind. With buffered they are only kept in level.files, by name, for the caller to write. Every
+# tunable comes from config
+def generate_level(seed, path, fitness_executor=None, room_observers=(), buffered=False, config=default_config):
+    level = Level(seed, path)
+    telemetry = open_telemetry(config, seed=seed)
+    if config.checkpoint_folder is not None:
+        os.makedirs(config.checkpoint_folder, exist_ok=True)
+    outputs = [io.StringIO() for _ in file_names]
+    walls_out, tiles_out, objects_out = outputs
+    rng = random.Random(seed)
+    scheduler = DeadlineScheduler(config.time_budget, config.stage_shares)
+    plateau = None if config.time_budget is None else config.plateau_window
+    steps = config.iterations
+    population_size = config.population_size
+
+    # Run the GA to generate rooms
+    mutate_rooms = partial(RoomChromosome.mutate, config=config)
+    room_fitness = partial(Fitness.mixed_room_fitness, config=config)
+    # Keying on the accepted rooms builds every child's map here. With an executor the maps are built by the
+    # workers, so the cache is keyed on the chromosomes and nothing is built before they are sent
+    if fitness_executor is None:
+        room_fitness_key = partial(Fitness.room_layout_key, config=config)
+    else:
+        room_fitness_key = RoomChromosome.gene_key
+    if config.islands_number > 1:
+        room_ga = IslandGeneticAlgorithm(
+            breeder=GeneticAlgorithm.uniform_crossover,
+            mutator=mutate_rooms,
+            initial=lambda island_rng: [RoomChromosome.generate_gene(island_rng, config.gene_length, config)
+                                        for _ in range(population_size)],
+            fitness=room_fitness,
+            _rng=rng,
+            executor=fitness_executor,
+            config=config
+        )
+    else:
+        room_ga = GeneticAlgorithm(
+            breeder=GeneticAlgorithm.uniform_crossover,
+            mutator=mutate_rooms,
+            initial=[RoomChromosome.generate_gene(rng, config.gene_length, config) for _ in range(population_size)],
+            fitness=room_fitness,
+            _rng=rng,
+            cache=FitnessCache(room_fitness_key, config),
+            executor=fitness_executor,
+            checkpoint=checkpoint_path(seed, "rooms", config),
+            config=config
+        )
+    for callback, every, interval in room_observers:
+        room_ga.observe(callback, every, interval)
+    if config.debug_output:
+        room_ga.observe(print_progress)
+    telemetry.watch(room_ga, "rooms")
+    with telemetry.stage("rooms"):
+        if config.islands_number > 1:
+            level.rooms = room_ga.compute(steps, scheduler.next_deadline(), plateau)
+        else:
+            level.rooms = run_stage(room_ga, steps, scheduler.next_deadline(), plateau)
+    level.fitness["rooms"] = room_ga.best()[1]
+    level.generations["rooms"] = room_ga.generations
+    level.timed("rooms")
+
+    # Run the GA to generate room types
+    room_type_ga = GeneticAlgorithm(
+        breeder=GeneticAlgorithm.uniform_crossover,
+        mutator=RoomTypeChromosome.mutate,
+        initial=[RoomTypeChromosome.generate_gene(rng, level.rooms) for _ in range(population_size)],
+        fitness=partial(Fitness.room_type_fitness, config=config),
+        _rng=rng,
+        cache=FitnessCache(RoomTypeChromosome.gene_key, config),
+        executor=fitness_executor,
+        checkpoint=checkpoint_path(seed, "room_types", config),
+        config=config
+    )
+    if config.debug_output:
+        room_type_ga.observe(print_progress)
+    telemetry.watch(room_type_ga, "room_types")
+    with telemetry.stage("room_types"):
+        level.room_types = run_stage(room_type_ga, steps, scheduler.next_deadline(), plateau)
+    level.fitness["room_types"] = room_type_ga.best()[1]
+    level.generations["room_types"] = room_type_ga.generations
+    level.timed("room_types")
+
+    # Transform the room layout to a HLM map
+    level.layout = layout = LayoutAnalysis(level.rooms, config=config)
+    with telemetry.stage("to_map"):
+        level.hotline_map, start_tile = HotlineSerializer.to_map(level.rooms, Point(*config.hero_position), rng,
+                                                                 layout)
+    with telemetry.stage("tiles"):
+        TileSerializer.serialize(level.room_types, tiles_out, rng, layout)
+
+    rooms_tiles = dict(layout.rooms_tiles)
+    narrow_corridors = layout.narrow_corridors
+    start_room = next(room for room, tiles in rooms_tiles.items() if start_tile in tiles)
+
+    # Generate furniture
+    available_rooms_tiles = {room: [tile for tile in tiles if tile not in narrow_corridors] for room, tiles in
+                             rooms_tiles.items()}
+    rooms_types = {chromosome.room.index: chromosome.room_type for chromosome in level.room_types}
+    with telemetry.stage("furniture"):
+        objects = []
+        level.occupied_tiles = FurnitureGenerator.place_objects(rng, level.hotline_map, rooms_types,
+                                                                available_rooms_tiles, objects)
+
+    distance_map = layout.graph.get_distance_map(start_room, layout.rooms_centers)
+    rooms_by_distance = sorted(distance_map, key=distance_map.get)
+    level.timed("furniture")
+
+    # Run the GA to generate enemies
+    enemies_ga = GeneticAlgorithm(
+        breeder=GeneticAlgorithm.uniform_crossover,
+        mutator=EnemyChromosome.mutate,
+        initial=[EnemyChromosome.generate_gene(rng, rooms_tiles, rooms_by_distance, level.occupied_tiles,
+                                               None if config.enemies_near_doors else level.hotline_map)
+                 for _ in range(population_size)],
+        fitness=partial(Fitness.enemy_fitness, config=config),
+        _rng=rng,
+        cache=FitnessCache(EnemyChromosome.gene_key, config),
+        executor=fitness_executor,
+        checkpoint=checkpoint_path(seed, "enemies", config),
+        config=config
+    )
+    if config.debug_output:
+        enemies_ga.observe(print_progress)
+    telemetry.watch(enemies_ga, "enemies")
+    with telemetry.stage("enemies"):
+        enemies_dominant = run_stage(enemies_ga, steps, scheduler.next_deadline(), plateau)
+    level.fitness["enemies"] = enemies_ga.best()[1]
+    level.generations["enemies"] = enemies_ga.generations
+    level.timed("enemies")
+
+    # Save the result
+    with telemetry.stage("serialize"):
+        WallSerializer.serialize(level.hotline_map, walls_out)
+        level.enemies = EnemySerializer.serialize(enemies_dominant, objects_out, objects)
+        level.files = {name: output.getvalue() for name, output in zip(file_names, outputs)}
+        if not buffered:
+            for name, content in level.files.items():
+                write_output(os.path.join(path, name), [content])
+    if not buffered:
+        remove_checkpoints(seed, config)
+    level.timed("serialize")
+    telemetry.record("level", timings=level.timings, fitness=level.fitness)
+    telemetry.close()
+    return level
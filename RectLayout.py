@@ -0,0 +1,304 @@
+from Geometry import Point, RectIndex
+from Room import RoomMap, RoomsGraph
+from config import *
+
+
+# Rectangles are (x0, y0, x1, y1) tuples with exclusive x1 and y1
+
+def bounds(rect):
+    return rect.x, rect.y, rect.x + rect.w, rect.y + rect.h
+
+
+def area(rect):
+    return (rect[2] - rect[0]) * (rect[3] - rect[1])
+
+
+def intersection(a, b):
+    x0, y0, x1, y1 = max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3])
+    if x0 < x1 and y0 < y1:
+        return x0, y0, x1, y1
+    return None
+
+
+# Parts of rect outside cut, at most four rectangles
+def subtract(rect, cut):
+    common = intersection(rect, cut)
+    if common is None:
+        return [rect]
+    x0, y0, x1, y1 = rect
+    cx0, cy0, cx1, cy1 = common
+    pieces = []
+    if x0 < cx0:
+        pieces.append((x0, y0, cx0, y1))
+    if cx1 < x1:
+        pieces.append((cx1, y0, x1, y1))
+    if y0 < cy0:
+        pieces.append((cx0, y0, cx1, cy0))
+    if cy1 < y1:
+        pieces.append((cx0, cy1, cx1, y1))
+    return pieces
+
+
+def transpose(rects):
+    return [(y0, x0, y1, x1) for x0, y0, x1, y1 in rects]
+
+
+# Splits the plane into horizontal slabs between the rectangles' y coordinates and yields
+# (y0, y1, sorted and merged x intervals covered by the rectangles) for every covered slab
+def slabs(rects):
+    ys = sorted({y for rect in rects for y in (rect[1], rect[3])})
+    for y0, y1 in zip(ys, ys[1:]):
+        intervals = covered(rects, y0, y1)
+        if intervals:
+            yield y0, y1, intervals
+
+
+def covered(rects, y0, y1):
+    return merge(sorted((rect[0], rect[2]) for rect in rects if rect[1] <= y0 and y1 <= rect[3]))
+
+
+def merge(intervals):
+    if not intervals:
+        return []
+    merged = [list(intervals[0])]
+    for x0, x1 in intervals[1:]:
+        if x0 <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], x1)
+        else:
+            merged.append([x0, x1])
+    return [tuple(interval) for interval in merged]
+
+
+def intersect_intervals(a, b):
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        x0, x1 = max(a[i][0], b[j][0]), min(a[i][1], b[j][1])
+        if x0 < x1:
+            result.append((x0, x1))
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def subtract_intervals(a, b):
+    result = []
+    for x0, x1 in a:
+        for cx0, cx1 in b:
+            if cx1 <= x0 or x1 <= cx0:
+                continue
+            if x0 < cx0:
+                result.append((x0, cx0))
+            x0 = max(x0, cx1)
+        if x0 < x1:
+            result.append((x0, x1))
+    return result
+
+
+# Rows (as rectangles) of the tiles whose left and right neighbours are outside the region
+def narrow_strips(region):
+    strips = []
+    for y0, y1, intervals in slabs(region):
+        strips += [(x0, y0, x1, y1) for x0, x1 in intervals if x1 - x0 == 1]
+    return strips
+
+
+def tiles(rects):
+    return [(x, y) for x0, y0, x1, y1 in rects for x in range(x0, x1) for y in range(y0, y1)]
+
+
+# Same answers as RoomMap, computed from the rooms' rectangles instead of a raster of the map, so the cost
+# grows with the number of rooms and not with the map area. Every room keeps its visible region as a list
+# of disjoint rectangles, the rooms' full rectangles are kept in a RectIndex
+class RectRoomMap(RoomMap):
+    def __init__(self, gene, config=default_config):
+        self.config = config
+        self.width = config.map_width
+        self.height = config.map_height
+        self.gene = gene
+        self.rooms = []
+        self.layout = None
+        self.regions = {}
+        self.index = RectIndex()
+        self.add_gene(gene)
+
+    # map_ is only needed by the serializers and the visualiser, it is painted on first access
+    def __getattr__(self, name):
+        if name != "map_":
+            raise AttributeError(name)
+        self.map_ = [[-1 for _ in range(self.height)] for _ in range(self.width)]
+        for room, region in self.regions.items():
+            for x, y in tiles(region):
+                self.map_[x][y] = room
+        return self.map_
+
+    def placed_near(self, chromosome):
+        near = set(self.index.query(chromosome.rect))
+        return [room for room in self.rooms if room.index in near]
+
+    def add_chromosome(self, chromosome):
+        if self.rooms and not self.overlaps(chromosome):
+            return False
+        for placed in self.placed_near(chromosome):
+            if chromosome.rect.crosses(placed.rect):
+                return False
+            if placed.rect.crosses(chromosome.rect):
+                return False
+        self.add_to_map(chromosome, chromosome.index)
+        self.rooms.append(chromosome)
+        return True
+
+    def add_to_map(self, chromosome, index):
+        rect = bounds(chromosome.rect)
+        near = self.index.query(chromosome.rect)
+        if chromosome.position == "Over":
+            for room in near:
+                self.regions[room] = [piece for placed in self.regions[room] for piece in subtract(placed, rect)]
+            visible = [rect]
+        else:
+            visible = [rect]
+            for room in near:
+                for placed in self.regions[room]:
+                    visible = [piece for part in visible for piece in subtract(part, placed)]
+        self.regions[index] = self.regions.get(index, []) + visible
+        self.index.insert(index, chromosome.rect)
+        self.__dict__.pop("map_", None)
+        return True
+
+    def overlaps(self, chromosome):
+        rect = bounds(chromosome.rect)
+        overlaps = False
+        covered = 0
+        for placed in self.placed_near(chromosome):
+            for piece in self.regions[placed.index]:
+                common = intersection(piece, rect)
+                if common is None:
+                    continue
+                covered += area(common)
+                if chromosome.connected[placed.index] and placed.connected[chromosome.index]:
+                    overlaps = True
+        visible = chromosome.position == "Over" or covered < area(rect)
+        return overlaps and visible
+
+    def room_regions(self):
+        # rooms in the order their first tile is met by a column-major scan, fully covered rooms are skipped
+        regions = [(min(region), room, region) for room, region in self.regions.items() if region]
+        return [(room, region) for _, room, region in sorted(regions)]
+
+    def get_building_area(self):
+        return sum(area(piece) for region in self.regions.values() for piece in region)
+
+    def get_rooms_area(self):
+        return {room: sum(area(piece) for piece in region) for room, region in self.room_regions()}
+
+    def get_rooms_tiles(self):
+        return {room: [Point(x, y) for x, y in sorted(tiles(region))] for room, region in self.room_regions()}
+
+    # (vertically narrow strips, horizontally narrow strips) of every room
+    def narrow_strips(self):
+        strips = []
+        for region in self.regions.values():
+            if region:
+                strips.append((narrow_strips(region), transpose(narrow_strips(transpose(region)))))
+        return strips
+
+    @staticmethod
+    def common_area(a, b):
+        return sum(area(common) for first in a for second in b
+                   for common in [intersection(first, second)] if common is not None)
+
+    def count_narrow_corridors(self):
+        return sum(area(strip) for vertical, horizontal in self.narrow_strips() for strip in vertical + horizontal) \
+            - 2 * self.count_tiny_corridors()
+
+    def count_tiny_corridors(self):
+        return sum(self.common_area(vertical, horizontal) for vertical, horizontal in self.narrow_strips())
+
+    def get_narrow_corridors(self):
+        result = set()
+        for vertical, horizontal in self.narrow_strips():
+            result |= set(tiles(vertical)) ^ set(tiles(horizontal))
+        return [Point(x, y) for x, y in sorted(result)]
+
+    def get_tiny_corridors(self):
+        result = set()
+        for vertical, horizontal in self.narrow_strips():
+            result |= set(tiles(vertical)) & set(tiles(horizontal))
+        return [Point(x, y) for x, y in sorted(result)]
+
+    # Same holes as RoomMap.is_hole. For every row the enclosed tiles lie between the first occupied tile
+    # (ignoring column 0) and the last one, the rows only change at the rooms' y coordinates, so each slab
+    # of rows gives one rectangle. Columns are handled the same way on the transposed rectangles
+    def hole_rects(self):
+        occupied = [piece for region in self.regions.values() for piece in region]
+        if not occupied:
+            return []
+        enclosed_rows = self.enclosed(occupied)
+        enclosed_columns = transpose(self.enclosed(transpose(occupied)))
+        holes = []
+        for y0, y1, _ in slabs(occupied + enclosed_rows + enclosed_columns):
+            inside = intersect_intervals(covered(enclosed_rows, y0, y1), covered(enclosed_columns, y0, y1))
+            holes += [(x0, y0, x1, y1) for x0, x1 in subtract_intervals(inside, covered(occupied, y0, y1))]
+        return holes
+
+    @staticmethod
+    def enclosed(occupied):
+        result = []
+        for y0, y1, intervals in slabs(occupied):
+            first = next((max(x0, 1) for x0, x1 in intervals if x1 > 1), None)
+            last = intervals[-1][1] - 1
+            if first is not None and first + 1 < last:
+                result.append((first + 1, y0, last, y1))
+        return result
+
+    def get_holes(self):
+        return [Point(x, y) for x, y in sorted(tiles(self.hole_rects()))]
+
+    def count_holes(self):
+        return sum(area(hole) for hole in self.hole_rects())
+
+    # Edges with the same discovery order as RoomsGraph(gene): for every pair of touching rooms the first
+    # (tile, neighbour) of a tile scan, found by matching the rooms' edges on the same x (or y) line
+    def edge_keys(self):
+        connected = {}
+        rooms = {room.index: room for room in self.rooms}
+        for a, b, key in self.contacts(self.regions, False) + \
+                self.contacts({room: transpose(region) for room, region in self.regions.items()}, True):
+            if not (rooms[a].connected[b] and rooms[b].connected[a]):
+                continue
+            pair = (min(a, b), max(a, b))
+            if pair not in connected or key < connected[pair]:
+                connected[pair] = key
+        return connected
+
+    # Touching (left room, right room, first event) of the regions, on transposed regions left and right
+    # become top and bottom. RoomMap.get_neighbours only looks right of x < height and below y < width
+    def contacts(self, regions, transposed):
+        width, height = self.width, self.height
+        right_edges, left_edges = {}, {}
+        for room, region in regions.items():
+            for x0, y0, x1, y1 in region:
+                right_edges.setdefault(x1, []).append((y0, y1, room))
+                left_edges.setdefault(x0, []).append((y0, y1, room))
+        result = []
+        for x, rights in right_edges.items():
+            for y0, y1, left_room in rights:
+                for ly0, ly1, right_room in left_edges.get(x, ()):
+                    start, end = max(y0, ly0), min(y1, ly1)
+                    if start >= end or left_room == right_room:
+                        continue
+                    if transposed:
+                        keys = [(start * height + x, 2)]
+                        if x - 1 < width - 1:
+                            keys.append((start * height + x - 1, 3))
+                    else:
+                        keys = [(x * height + start, 0)]
+                        if x - 1 < height - 1:
+                            keys.append(((x - 1) * height + start, 1))
+                    result.append((left_room, right_room, min(keys)))
+        return result
+
+    def get_graph(self):
+        return RoomsGraph.from_edges(self.rooms, self.edge_keys())
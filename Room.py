@@ -1,13 +1,22 @@
-from queue import Queue
+from array import array
+from collections import OrderedDict
+from functools import lru_cache
+from heapq import heappop, heappush
+from threading import Lock
 
 from Geometry import Point
 from config import *
 
 
 class RoomMap:
-    def __init__(self, gene):
-        self.map_ = [[-1 for _ in range(map_height)] for _ in range(map_width)]
+    def __init__(self, gene, config=default_config):
+        self.config = config
+        self.width = config.map_width
+        self.height = config.map_height
+        self.map_ = [[-1 for _ in range(self.height)] for _ in range(self.width)]
         self.rooms = []
+        self.gene = gene
+        self.layout = None
         self.add_gene(gene)
 
     def add_gene(self, gene):
@@ -51,12 +60,15 @@ class RoomMap:
 
     def get_holes(self):
         holes = []
-        for x in range(map_width):
-            for y in range(map_height):
+        for x in range(self.width):
+            for y in range(self.height):
                 if self.is_hole(x, y):
                     holes.append(Point(x, y))
         return holes
 
+    def count_holes(self):
+        return len(self.get_holes())
+
     # checks if the point is surrounded by tiles from all sides(not necessarily adjacent)
     def is_hole(self, x, y):
         if self.map_[x][y] != -1:
@@ -66,7 +78,7 @@ class RoomMap:
                 break
         else:
             return False
-        for i in range(x, map_width):
+        for i in range(x, self.width):
             if self.map_[i][y] != -1:
                 break
         else:
@@ -76,7 +88,7 @@ class RoomMap:
                 break
         else:
             return False
-        for i in range(y, map_height):
+        for i in range(y, self.height):
             if self.map_[x][i] != -1:
                 break
         else:
@@ -89,11 +101,11 @@ class RoomMap:
         points = []
         if x - 1 >= 0:
             points.append(Point(x - 1, y))
-        if x + 1 < map_height:
+        if x + 1 < self.height:
             points.append(Point(x + 1, y))
         if y - 1 >= 0:
             points.append(Point(x, y - 1))
-        if y + 1 < map_width:
+        if y + 1 < self.width:
             points.append(Point(x, y + 1))
         return points
 
@@ -101,6 +113,9 @@ class RoomMap:
         return len(self.rooms)
         # return len(self.get_rooms_area())
 
+    def get_graph(self):
+        return RoomsGraph(self.gene, self)
+
     def get_building_area(self):
         return sum(self.get_rooms_area().values())
 
@@ -110,8 +125,8 @@ class RoomMap:
 
     def get_rooms_tiles(self):
         room_area = {}
-        for x in range(map_width):
-            for y in range(map_height):
+        for x in range(self.width):
+            for y in range(self.height):
                 tile = self.map_[x][y]
                 if tile != -1:
                     if tile in room_area:
@@ -126,8 +141,8 @@ class RoomMap:
 
     def get_narrow_corridors(self):
         result = []
-        for x in range(map_width):
-            for y in range(map_height):
+        for x in range(self.width):
+            for y in range(self.height):
                 if self.map_[x][y] == -1:
                     continue
                 if self.horizontally_narrow(x, y) != self.vertically_narrow(x, y):
@@ -138,14 +153,20 @@ class RoomMap:
     # also only true once in a millenia :/
     def get_tiny_corridors(self):
         result = []
-        for x in range(map_width):
-            for y in range(map_height):
+        for x in range(self.width):
+            for y in range(self.height):
                 if self.map_[x][y] == -1:
                     continue
                 if self.horizontally_narrow(x, y) and self.vertically_narrow(x, y):
                     result.append(Point(x, y))
         return result
 
+    def count_narrow_corridors(self):
+        return len(self.get_narrow_corridors())
+
+    def count_tiny_corridors(self):
+        return len(self.get_tiny_corridors())
+
     def vertically_narrow(self, x, y):
         return ((x == 0 or self.map_[x][y] != self.map_[x - 1][y]) and
                 (x + 1 == len(self.map_) or self.map_[x][y] != self.map_[x + 1][y]))
@@ -155,13 +176,354 @@ class RoomMap:
                 (y + 1 == len(self.map_[0]) or self.map_[x][y] != self.map_[x][y + 1]))
 
 
+# Iterates over the indexes of the set bits of a mask in ascending order
+def mask_bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def popcount(mask):
+    return bin(mask).count("1")
+
+
+# Masks of the tiles with y == 0 and y == height - 1 in a column-major bitboard
+def edge_rows(width, height):
+    top = 0
+    for x in range(width):
+        top |= 1 << (x * height)
+    return top, top << (height - 1)
+
+
+def tiles_mask(columns, rows, height):
+    mask = 0
+    for x in columns:
+        for y in rows:
+            mask |= 1 << (x * height + y)
+    return mask
+
+
+# (top row, bottom row, right checked, down checked) masks of a map size, shared by all its maps.
+# RoomMap.get_neighbours compares x with the height and y with the width, kept for the edges order
+@lru_cache(maxsize=None)
+def board_masks(width, height):
+    top_row, bottom_row = edge_rows(width, height)
+    right_checked = tiles_mask(range(min(width, height - 1)), range(height), height)
+    down_checked = tiles_mask(range(width), range(min(height, width - 1)), height)
+    return top_row, bottom_row, right_checked, down_checked
+
+
+# Same answers as RoomMap, but the map is kept as one bitmask per room (tile (x, y) is bit x * height + y)
+# so the analysis is done with shifts instead of tile by tile loops. The int16 grid is painted from the
+# accepted rooms' rectangles on first access
+class ArrayRoomMap(RoomMap):
+    def __init__(self, gene, config=default_config):
+        self.config = config
+        self.width = config.map_width
+        self.height = config.map_height
+        self.top_row, self.bottom_row, self.right_checked, self.down_checked = board_masks(self.width, self.height)
+        self.gene = []
+        self.masks = {}
+        self.occupied = 0
+        self.rooms = []
+        # (chromosome, painted tiles) of the accepted rooms, in painting order
+        self.paints = []
+        # (masks, occupied, number of accepted rooms) after each chromosome of the gene
+        self.states = []
+        # per room (vertically narrow, horizontally narrow) masks
+        self.narrow = {}
+        self.graph = None
+        self.base = None
+        self.layout = None
+        self.add_gene(gene)
+
+    # grid and map_ are built on first access after a change
+    def __getattr__(self, name):
+        if name == "grid":
+            grid = array("h", [-1]) * (self.width * self.height)
+            for chromosome, painted in self.paints:
+                self.paint(grid, chromosome, painted)
+            self.grid = grid
+            return grid
+        if name == "map_":
+            grid = self.grid
+            height = self.height
+            self.map_ = [grid[x * height:(x + 1) * height].tolist() for x in range(self.width)]
+            return self.map_
+        raise AttributeError(name)
+
+    def tile(self, x, y):
+        return self.grid[x * self.height + y]
+
+    def rect_mask(self, rect):
+        column = ((1 << rect.h) - 1) << rect.y
+        mask = 0
+        for x in range(rect.x, rect.x + rect.w):
+            mask |= column << (x * self.height)
+        return mask
+
+    def paint(self, grid, chromosome, painted):
+        rect = chromosome.rect
+        index = chromosome.index
+        if painted == self.rect_mask(rect):
+            column = array("h", [index]) * rect.h
+            for x in range(rect.x, rect.x + rect.w):
+                start = x * self.height + rect.y
+                grid[start:start + rect.h] = column
+        else:
+            for i in mask_bits(painted):
+                grid[i] = index
+
+    def add_gene(self, gene):
+        for chromosome in gene:
+            self.add_chromosome(chromosome)
+            self.gene.append(chromosome)
+            self.states.append((dict(self.masks), self.occupied, len(self.rooms)))
+
+    def add_to_map(self, chromosome, index):
+        rect_mask = self.rect_mask(chromosome.rect)
+        if chromosome.position == "Over":
+            painted = rect_mask
+            for room in self.masks:
+                self.masks[room] &= ~rect_mask
+        else:
+            painted = rect_mask & ~self.occupied
+        self.masks[index] = self.masks.get(index, 0) | painted
+        self.occupied |= rect_mask
+        self.paints.append((chromosome, painted))
+        self.__dict__.pop("grid", None)
+        self.__dict__.pop("map_", None)
+        return True
+
+    def overlaps(self, chromosome):
+        rect_mask = self.rect_mask(chromosome.rect)
+        visible = chromosome.position == "Over" or rect_mask & ~self.occupied != 0
+        if not visible:
+            return False
+        for placed in self.rooms:
+            if self.masks[placed.index] & rect_mask and \
+                    chromosome.connected[placed.index] and placed.connected[chromosome.index]:
+                return True
+        return False
+
+    # Builds the map of a gene that shares chromosomes with this one. The chromosomes before the first
+    # different one are not placed again, and once the placed rooms are back to this map's rooms the rest
+    # is copied. Cached per room results are kept for the rooms whose tiles did not change
+    def derive(self, gene):
+        length = min(len(gene), len(self.gene))
+        start = 0
+        while start < length and gene[start] is self.gene[start]:
+            start += 1
+        if start == len(gene) == len(self.gene):
+            return self
+        shared_from = len(gene)
+        if len(gene) == len(self.gene):
+            while shared_from > start and gene[shared_from - 1] is self.gene[shared_from - 1]:
+                shared_from -= 1
+
+        child = ArrayRoomMap([], self.config)
+        if start:
+            masks, child.occupied, count = self.states[start - 1]
+            child.masks = dict(masks)
+            child.rooms = self.rooms[:count]
+            child.paints = self.paints[:count]
+            child.states = self.states[:start]
+            child.gene = self.gene[:start]
+        for i in range(start, len(gene)):
+            child.add_gene([gene[i]])
+            count = len(child.rooms)
+            if i + 1 >= shared_from and count == self.states[i][2] and \
+                    all(a is b for a, b in zip(child.rooms, self.rooms)):
+                child.gene += gene[i + 1:]
+                child.rooms += self.rooms[count:]
+                child.paints += self.paints[count:]
+                child.states += self.states[i + 1:]
+                child.masks = dict(self.masks)
+                child.occupied = self.occupied
+                break
+
+        if "grid" in self.__dict__:
+            grid = self.grid[:]
+            for room, mask in child.masks.items():
+                for i in mask_bits(mask & ~self.masks.get(room, 0)):
+                    grid[i] = room
+            for i in mask_bits(self.occupied & ~child.occupied):
+                grid[i] = -1
+            child.grid = grid
+        for room, mask in child.masks.items():
+            if room in self.narrow and self.masks.get(room) == mask:
+                child.narrow[room] = self.narrow[room]
+        if self.graph is not None:
+            child.base = self
+        return child
+
+    # Same holes as RoomMap.is_hole, found with "seen a room tile before/after" prefix scans: one pass over
+    # the columns in each direction for the rows, and the lowest/highest tile of each column for the columns.
+    # Like is_hole, tiles in the row and column 0 never count as the tile before
+    def hole_mask(self):
+        width, height = self.width, self.height
+        column_mask = (1 << height) - 1
+        columns = [self.occupied >> (x * height) & column_mask for x in range(width)]
+        after = [0] * width
+        seen = 0
+        for x in range(width - 1, -1, -1):
+            after[x] = seen
+            seen |= columns[x]
+        holes = 0
+        seen = 0
+        for x in range(1, width):
+            column = columns[x]
+            enclosed = seen & after[x] & ~column
+            seen |= column
+            below = column & ~1
+            if not enclosed or not below:
+                continue
+            # between the first tile (ignoring row 0) and the last tile of the column
+            first = (below & -below).bit_length() - 1
+            enclosed &= ((1 << (below.bit_length() - 1)) - 1) & ~((1 << (first + 1)) - 1)
+            holes |= enclosed << (x * height)
+        return holes
+
+    def get_holes(self):
+        return self.points(self.hole_mask())
+
+    def count_holes(self):
+        return popcount(self.hole_mask())
+
+    def room_masks(self):
+        # rooms in the order their first tile is met by a column-major scan, fully covered rooms are skipped
+        masks = [(mask & -mask, room, mask) for room, mask in self.masks.items() if mask]
+        return [(room, mask) for _, room, mask in sorted(masks)]
+
+    def get_building_area(self):
+        return popcount(self.occupied)
+
+    def get_rooms_area(self):
+        return {room: popcount(mask) for room, mask in self.room_masks()}
+
+    def get_rooms_tiles(self):
+        return {room: self.points(mask) for room, mask in self.room_masks()}
+
+    def points(self, mask):
+        return [Point(*divmod(i, self.height)) for i in mask_bits(mask)]
+
+    # tiles whose left and right (or top and bottom) neighbours belong to other rooms
+    def narrow_masks(self):
+        vertical = horizontal = 0
+        for room, mask in self.masks.items():
+            if room not in self.narrow:
+                self.narrow[room] = (
+                    mask & ~(mask << self.height) & ~(mask >> self.height),
+                    mask & ~(mask << 1 & ~self.top_row) & ~(mask >> 1 & ~self.bottom_row))
+            room_vertical, room_horizontal = self.narrow[room]
+            vertical |= room_vertical
+            horizontal |= room_horizontal
+        return vertical, horizontal
+
+    def narrow_corridors_mask(self):
+        vertical, horizontal = self.narrow_masks()
+        return vertical ^ horizontal
+
+    def tiny_corridors_mask(self):
+        vertical, horizontal = self.narrow_masks()
+        return vertical & horizontal
+
+    def get_narrow_corridors(self):
+        return self.points(self.narrow_corridors_mask())
+
+    def count_narrow_corridors(self):
+        return popcount(self.narrow_corridors_mask())
+
+    def count_tiny_corridors(self):
+        return popcount(self.tiny_corridors_mask())
+
+    def get_tiny_corridors(self):
+        return self.points(self.tiny_corridors_mask())
+
+    # First (tile, neighbour) pair of a RoomMap scan that links rooms a and b, None if they do not touch
+    def edge_key(self, a, b):
+        first = None
+        for near, far in ((a, b), (b, a)):
+            near, far = self.masks[near], self.masks[far]
+            for direction, touching in enumerate((
+                    near & far << self.height,
+                    near & far >> self.height & self.right_checked,
+                    near & far << 1 & ~self.top_row,
+                    near & far >> 1 & self.down_checked)):
+                if touching:
+                    key = ((touching & -touching).bit_length() - 1, direction)
+                    if first is None or key < first:
+                        first = key
+        return first
+
+    def get_graph(self):
+        if self.graph is None:
+            self.graph = RoomsGraph.from_room_map(self, self.base)
+            self.base = None
+        return self.graph
+
+
+# Keeps the last built maps, a new gene is derived from the one it shares the longest prefix with. The maps
+# are indexed by the ids of the chromosomes of every prefix of their gene, so finding the parent takes a few
+# dict lookups whatever the size of the history. A map keeps its chromosomes alive, so the ids of its entries
+# are not reused while it is stored, and its entries go with it
+class RoomMapHistory:
+    def __init__(self, size, config=default_config):
+        self.size = size
+        self.config = config
+        # id of a map: map, least recently used first
+        self.maps = OrderedDict()
+        # ids of a gene prefix: the last used map with that prefix
+        self.prefixes = {}
+        self.lock = Lock()
+
+    @staticmethod
+    def prefix_keys(gene):
+        ids = tuple(id(chromosome) for chromosome in gene)
+        return [ids[:length] for length in range(1, len(ids) + 1)]
+
+    def store(self, room_map):
+        self.maps[id(room_map)] = room_map
+        self.maps.move_to_end(id(room_map))
+        for key in self.prefix_keys(room_map.gene):
+            self.prefixes[key] = room_map
+
+    def evict(self, room_map):
+        del self.maps[id(room_map)]
+        for key in self.prefix_keys(room_map.gene):
+            if self.prefixes.get(key) is room_map:
+                del self.prefixes[key]
+
+    # the lock keeps the history consistent when islands or fitness evaluations run on threads
+    def build(self, gene):
+        with self.lock:
+            best = None
+            for key in reversed(self.prefix_keys(gene)):
+                if key in self.prefixes:
+                    best = self.prefixes[key]
+                    break
+            if best is None:
+                room_map = ArrayRoomMap(gene, self.config)
+            else:
+                room_map = best.derive(gene)
+                self.store(best)
+            if room_map is not best:
+                self.store(room_map)
+                if len(self.maps) > self.size:
+                    self.evict(next(iter(self.maps.values())))
+            return room_map
+
+
 class RoomsGraph:
-    def __init__(self, gene):
-        room_map = RoomMap(gene)
+    def __init__(self, gene, room_map=None, config=default_config):
+        if room_map is None:
+            room_map = RoomMap(gene, config)
         self.AdjMatrix = {room.index: [] for room in room_map.rooms}
+        self.hops = None
         map_ = room_map.map_
-        for x in range(map_width):
-            for y in range(map_height):
+        for x in range(room_map.width):
+            for y in range(room_map.height):
                 if map_[x][y] == -1:
                     continue
                 neighbours = room_map.get_neighbours(x, y)
@@ -174,20 +536,82 @@ class RoomsGraph:
                             self.add_edge(cur_index, neighbour_index)
                             self.add_edge(neighbour_index, cur_index)
 
+    # Builds the graph from an ArrayRoomMap with the same adjacency lists as RoomsGraph(gene). Edges are found
+    # with mask shifts, pairs of rooms placed the same way as in the base map keep the base graph's edges
+    @staticmethod
+    def from_room_map(room_map, base=None):
+        unchanged = set()
+        if base is not None:
+            base_rooms = {room.index: room for room in base.rooms}
+            unchanged = {room.index for room in room_map.rooms if base_rooms.get(room.index) is room and
+                         base.masks[room.index] == room_map.masks[room.index]}
+        edges = {}
+        rooms = room_map.rooms
+        for i, a in enumerate(rooms):
+            for b in rooms[i + 1:]:
+                if a.index in unchanged and b.index in unchanged:
+                    key = base.graph.edges.get((a.index, b.index))
+                elif a.connected[b.index] and b.connected[a.index]:
+                    key = room_map.edge_key(a.index, b.index)
+                else:
+                    key = None
+                if key is not None:
+                    edges[(a.index, b.index)] = key
+        return RoomsGraph.from_edges(rooms, edges)
+
+    # edges maps (room, later room) to the first (tile, neighbour) of a tile scan that links them, they are
+    # added in that order so the adjacency lists are the same as the ones RoomsGraph(gene) builds
+    @staticmethod
+    def from_edges(rooms, edges):
+        graph = RoomsGraph.__new__(RoomsGraph)
+        graph.AdjMatrix = {room.index: [] for room in rooms}
+        graph.hops = None
+        graph.edges = edges
+        for a, b in sorted(edges, key=edges.get):
+            graph.add_edge(a, b)
+            graph.add_edge(b, a)
+        return graph
+
     def add_edge(self, v1, v2):
         if v1 not in self.AdjMatrix:
             self.AdjMatrix[v1] = []
         if v2 not in self.AdjMatrix[v1]:
             self.AdjMatrix[v1].append(v2)
+            self.hops = None
+
+    # adjacency as one bitmask of neighbour room indexes per room
+    def rows(self):
+        return {v: sum(1 << u for u in neighbours) for v, neighbours in self.AdjMatrix.items()}
+
+    # Hop distances between all pairs of rooms, {from: {to: distance}} without the unreachable rooms.
+    # Every room's reachable set grows by its neighbours' sets once per level, so the whole matrix
+    # takes one pass over the edges per level instead of a BFS per room
+    def get_hop_distances(self):
+        if self.hops is None:
+            rows = self.rows()
+            reach = {v: 1 << v for v in rows}
+            self.hops = {v: {v: 0} for v in rows}
+            level = 0
+            changed = True
+            while changed:
+                level += 1
+                changed = False
+                grown = {}
+                for v, row in rows.items():
+                    reached = reach[v]
+                    for u in mask_bits(row):
+                        reached |= reach[u]
+                    grown[v] = reached
+                    for u in mask_bits(reached & ~reach[v]):
+                        self.hops[v][u] = level
+                        changed = True
+                reach = grown
+        return self.hops
 
     def connected(self):
         if not self.AdjMatrix:
             return True
-        distance_map = self.get_distance_map(list(self.AdjMatrix)[0])
-        for vertex in self.AdjMatrix:
-            if distance_map[vertex] == -1:
-                return False
-        return True
+        return len(self.get_hop_distances()[next(iter(self.AdjMatrix))]) == len(self.AdjMatrix)
 
     def average_degree(self):
         result = 0
@@ -196,25 +620,25 @@ class RoomsGraph:
             result += len(self.AdjMatrix[vertex]) / n
         return result
 
+    # Hop distances from start, or shortest paths between the rooms centers if they are given
     def get_distance_map(self, start, rooms_centers=None):
+        if not rooms_centers:
+            hops = self.get_hop_distances()[start]
+            return {v: hops.get(v, -1) for v in self.AdjMatrix}
         distance = {v: -1 for v in self.AdjMatrix}
-        distance[start] = 0
-        queue = Queue()
-        queue.put(start)
-        while queue.qsize() != 0:
-            v = queue.get()
+        heap = [(0, start)]
+        while heap:
+            d, v = heappop(heap)
+            if distance[v] != -1:
+                continue
+            distance[v] = d
             for i in self.AdjMatrix[v]:
                 if distance[i] == -1:
-                    weight = 1
-                    if rooms_centers:
-                        weight = rooms_centers[i].square_distance(rooms_centers[v])
-                    distance[i] = distance[v] + weight
-                    queue.put(i)
+                    heappush(heap, (d + rooms_centers[i].square_distance(rooms_centers[v]), i))
         return distance
 
     def get_diameter(self):
         diameter = 0
-        for v in self.AdjMatrix:
-            max_distance = max(self.get_distance_map(v).values())
-            diameter = max(max_distance, diameter)
+        for distances in self.get_hop_distances().values():
+            diameter = max(max(distances.values()), diameter)
         return diameter
@@ -0,0 +1,103 @@
+from bisect import insort
+
+from config import *
+
+
+# How a GeneticAlgorithm picks parents and replaces individuals. Populations are lists of (gene, fitness)
+# sorted from the best, step breeds children with breed(parent1, parent2), evaluates them with
+# evaluate_all(genes) and returns the next population. The strategies take their parameters from a config
+class Strategy:
+    def __init__(self, config=default_config):
+        pass
+
+    def sort(self, population):
+        return sorted(population, key=lambda x: (-x[1]))
+
+    # index of the best of size random individuals, the population is sorted
+    @staticmethod
+    def tournament(population, size, _rng):
+        return min(_rng.sample(range(len(population)), min(size, len(population))))
+
+    def step(self, population, breed, evaluate_all, _rng):
+        raise NotImplementedError
+
+
+# The original scheme: every child is bred from the two best individuals and replaces everyone else
+class BestPair(Strategy):
+    def step(self, population, breed, evaluate_all, _rng):
+        genes = []
+        for i in range(2, len(population)):
+            genes.append(breed(population[0][0], population[1][0]))
+        population[2:] = zip(genes, evaluate_all(genes))
+        return population
+
+
+# Keeps the elites best individuals, the others are replaced by children of tournament winners
+class Tournament(Strategy):
+    def __init__(self, config=default_config):
+        self.size = config.tournament_size
+        self.elites = config.elites_number
+
+    def parent(self, population, _rng):
+        return population[self.tournament(population, self.size, _rng)][0]
+
+    def step(self, population, breed, evaluate_all, _rng):
+        genes = []
+        for i in range(self.elites, len(population)):
+            genes.append(breed(self.parent(population, _rng), self.parent(population, _rng)))
+        population[self.elites:] = zip(genes, evaluate_all(genes))
+        return population
+
+
+# Like Tournament, with parents drawn with weights falling linearly with their rank
+class Rank(Tournament):
+    def __init__(self, config=default_config):
+        self.elites = config.elites_number
+
+    def parent(self, population, _rng):
+        size = len(population)
+        return _rng.choices(population, cum_weights=[(k + 1) * (2 * size - k) // 2 for k in range(size)])[0][0]
+
+
+# (mu + lambda): children of random parents compete with their parents, the best len(population) survive
+class MuPlusLambda(Strategy):
+    def __init__(self, config=default_config):
+        self.children = config.population_size
+
+    def step(self, population, breed, evaluate_all, _rng):
+        genes = [breed(_rng.choice(population)[0], _rng.choice(population)[0]) for _ in range(self.children)]
+        return self.sort(population + list(zip(genes, evaluate_all(genes))))[:len(population)]
+
+
+# Steady state: a generation breeds a few children of tournament winners and each one replaces the worst
+# individual if it is better. The children are inserted into the sorted population, so it is never
+# sorted again
+class SteadyState(Strategy):
+    def __init__(self, config=default_config):
+        self.children = config.steady_state_children
+        self.size = config.tournament_size
+
+    def sort(self, population):
+        if all(population[k][1] >= population[k + 1][1] for k in range(len(population) - 1)):
+            return population
+        return super().sort(population)
+
+    def step(self, population, breed, evaluate_all, _rng):
+        genes = []
+        for _ in range(self.children):
+            genes.append(breed(population[self.tournament(population, self.size, _rng)][0],
+                               population[self.tournament(population, self.size, _rng)][0]))
+        for child in zip(genes, evaluate_all(genes)):
+            if child[1] > population[-1][1]:
+                population.pop()
+                insort(population, child, key=lambda x: -x[1])
+        return population
+
+
+strategies = {"best_pair": BestPair, "tournament": Tournament, "rank": Rank, "mu_plus_lambda": MuPlusLambda,
+              "steady_state": SteadyState}
+
+
+# The config's selection_strategy with its parameters
+def make_strategy(config=default_config):
+    return strategies[config.selection_strategy](config)
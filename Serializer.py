@@ -1,108 +1,117 @@
+import os
+from functools import lru_cache
+
 from Geometry import Point
-from Room import RoomMap
+from Layout import LayoutAnalysis
+from Walls import WallMap
 from config import *
 
 
+# Serializers collect their output as a list of strings and write it with one call, to a file path or to an
+# already open text file such as an io.StringIO. A path is written to a temporary file that then replaces
+# it, so a level folder never holds a partly written file
+def write_output(target, chunks):
+    text = "".join(chunks)
+    if not isinstance(target, str):
+        target.write(text)
+        return
+    temporary = target + ".tmp"
+    with open(temporary, "w") as f:
+        f.write(text)
+    os.replace(temporary, target)
+
+
 class HotlineSerializer:
+    # The level's WallMap: the rooms' walls, a door (or an open wall of transitions when all the shared walls
+    # are corners) between every two connected rooms and the entrance closest to the hero
     @staticmethod
-    def to_map(gene, hero_position, _rng):
-        map_ = [[{} for _ in range(map_height)] for _ in range(map_width)]
-        room_map = RoomMap(gene)
-        for i in range(len(gene)):
-            HotlineSerializer.fill_wall(room_map, i, map_)
+    def to_map(gene, hero_position, _rng, layout=None, config=default_config):
+        room_map = (layout or LayoutAnalysis(gene, config=config)).room_map
+        walls = WallMap.from_room_map(room_map)
 
+        shared_walls = HotlineSerializer.get_shared_walls(room_map)
         for i in range(len(gene)):
             for j in range(i + 1, len(gene)):
                 if not gene[j].connected[i] or not gene[i].connected[j]:
                     continue
-                possible_doors = HotlineSerializer.get_possible_doors(room_map, i, j)
+                possible_doors = shared_walls.get((i, j), [])
                 not_corner_walls = list(filter(lambda x: not x[3], possible_doors))
                 if not_corner_walls:
-                    index = _rng.randrange(len(not_corner_walls))
-                    if not_corner_walls[index][2] == "Vertical":
-                        map_[not_corner_walls[index][0]][not_corner_walls[index][1]]["VerticalWall"] = ("Door", 0)
-                        map_[not_corner_walls[index][0] - 1][not_corner_walls[index][1]]["VerticalWall"] = (
-                            "Transition", 0)
+                    x, y, orientation, _ = not_corner_walls[_rng.randrange(len(not_corner_walls))]
+                    if orientation == "Vertical":
+                        walls.set(x, y, 0, "Door")
+                        walls.set(x - 1, y, 0, "Transition")
                     else:
-                        map_[not_corner_walls[index][0]][not_corner_walls[index][1]]["HorizontalWall"] = ("Door", 1)
-                        map_[not_corner_walls[index][0]][not_corner_walls[index][1] - 1]["HorizontalWall"] = (
-                            "Transition", 1)
+                        walls.set(x, y, 1, "Door")
+                        walls.set(x, y - 1, 1, "Transition")
                 else:
-                    for wall in possible_doors:
-                        if wall[2] == "Vertical":
-                            map_[wall[0]][wall[1]]["VerticalWall"] = ("Transition", 0)
-                            map_[wall[0] - 1][wall[1]]["VerticalWall"] = ("Transition", 0)
-                        if wall[2] == "Horizontal":
-                            map_[wall[0]][wall[1]]["HorizontalWall"] = ("Transition", 1)
-                            map_[wall[0]][wall[1] - 1]["HorizontalWall"] = ("Transition", 1)
+                    for x, y, orientation, _ in possible_doors:
+                        if orientation == "Vertical":
+                            walls.set(x, y, 0, "Transition")
+                            walls.set(x - 1, y, 0, "Transition")
+                        if orientation == "Horizontal":
+                            walls.set(x, y, 1, "Transition")
+                            walls.set(x, y - 1, 1, "Transition")
 
-        start_tile = HotlineSerializer.place_entrance(map_, hero_position)
+        start_tile = HotlineSerializer.place_entrance(walls, hero_position)
         start_tile.y -= 1
-        return map_, start_tile
+        return walls, start_tile
 
+    # The horizontal wall closest to the hero without vertical walls above its ends becomes the entrance
     @staticmethod
-    def place_entrance(map_, hero_position):
+    def place_entrance(walls, hero_position):
         min_distance = 10000
         min_point = Point(-1, -1)
-        for x in range(map_width):
-            for y in range(map_height):
-                if "HorizontalWall" in map_[x][y] and \
-                                "VerticalWall" not in map_[x][y - 1] and \
-                                "VerticalWall" not in map_[x + 1][y - 1]:
-                    distance = abs(x - hero_position.x) + abs(y - hero_position.y)
-                    if distance < min_distance:
-                        min_distance = distance
-                        min_point = Point(x, y)
-        map_[min_point.x][min_point.y]["HorizontalWall"] = ("Door", 1)
-        map_[min_point.x][min_point.y - 1]["HorizontalWall"] = ("Transition", 1)
+        vertical, horizontal = walls.layers
+        height = walls.height
+        for i, wall in enumerate(horizontal):
+            if wall and not vertical[i - 1] and not vertical[i + height - 1]:
+                x, y = divmod(i, height)
+                distance = abs(x - hero_position.x) + abs(y - hero_position.y)
+                if distance < min_distance:
+                    min_distance = distance
+                    min_point = Point(x, y)
+        walls.set(min_point.x, min_point.y, 1, "Door")
+        walls.set(min_point.x, min_point.y - 1, 1, "Transition")
         return min_point
 
+    # The walls between every two touching rooms, found in one scan of the map. Maps (room, higher room) to
+    # the (x, y, orientation, corner) walls on the first room's tiles, in tile scan order, so a pair's list is
+    # the same as the one a scan for that pair alone would give
     @staticmethod
-    def fill_wall(room_map, i, map_):
-        for x in range(map_width):
-            for y in range(map_height):
-                if room_map.map_[x][y] == i:
-                    if x == 0 or room_map.map_[x - 1][y] != i:
-                        map_[x][y]["VerticalWall"] = ("Standard", 0)
-                    if y == 0 or room_map.map_[x][y - 1] != i:
-                        map_[x][y]["HorizontalWall"] = ("Standard", 1)
-                    if x == 0 or room_map.map_[x - 1][y] == -1:
-                        map_[x][y]["VerticalWall"] = ("RedBrick", 0)
-                    if y == 0 or room_map.map_[x][y - 1] == -1:
-                        map_[x][y]["HorizontalWall"] = ("RedBrick", 1)
-                if y + 1 < map_height and room_map.map_[x][y] == i and room_map.map_[x][y + 1] == -1:
-                    map_[x][y + 1]["HorizontalWall"] = ("RedBrick", 1)
-                if x + 1 < map_width and room_map.map_[x][y] == i and room_map.map_[x + 1][y] == -1:
-                    map_[x + 1][y]["VerticalWall"] = ("RedBrick", 0)
-
-    @staticmethod
-    def get_possible_doors(room_map, room1, room2):
-        result = []
-        for x in range(map_width):
-            for y in range(map_height):
-                if x > 0 and room_map.map_[x][y] == room1 and room_map.map_[x - 1][y] == room2:
+    def get_shared_walls(room_map):
+        walls = {}
+        map_ = room_map.map_
+        width, height = room_map.width, room_map.height
+        for x in range(width):
+            column = map_[x]
+            for y in range(height):
+                room = column[y]
+                if room == -1:
+                    continue
+                if x > 0 and room < map_[x - 1][y]:
                     is_corner = HotlineSerializer.is_vertical_corner(room_map, x, y, x - 1, y)
-                    result.append((x, y, "Vertical", is_corner))
-                if x + 1 < map_width and room_map.map_[x][y] == room1 and room_map.map_[x + 1][y] == room2:
+                    walls.setdefault((room, map_[x - 1][y]), []).append((x, y, "Vertical", is_corner))
+                if x + 1 < width and room < map_[x + 1][y]:
                     is_corner = HotlineSerializer.is_vertical_corner(room_map, x, y, x + 1, y)
-                    result.append((x + 1, y, "Vertical", is_corner))
-                if y > 0 and room_map.map_[x][y] == room1 and room_map.map_[x][y - 1] == room2:
+                    walls.setdefault((room, map_[x + 1][y]), []).append((x + 1, y, "Vertical", is_corner))
+                if y > 0 and room < column[y - 1]:
                     is_corner = HotlineSerializer.is_horizontal_corner(room_map, x, y, x, y - 1)
-                    result.append((x, y, "Horizontal", is_corner))
-                if y + 1 < map_height and room_map.map_[x][y] == room1 and room_map.map_[x][y + 1] == room2:
+                    walls.setdefault((room, column[y - 1]), []).append((x, y, "Horizontal", is_corner))
+                if y + 1 < height and room < column[y + 1]:
                     is_corner = HotlineSerializer.is_horizontal_corner(room_map, x, y, x, y + 1)
-                    result.append((x, y + 1, "Horizontal", is_corner))
-        return result
+                    walls.setdefault((room, column[y + 1]), []).append((x, y + 1, "Horizontal", is_corner))
+        return walls
 
     @staticmethod
     def is_horizontal_corner(room_map, xtop, ytop, xbot, ybot):
         if xtop == 0 or room_map.map_[xtop][ytop] != room_map.map_[xtop - 1][ytop]:
             return True
-        if xtop == map_width - 1 or room_map.map_[xtop][ytop] != room_map.map_[xtop + 1][ytop]:
+        if xtop == room_map.width - 1 or room_map.map_[xtop][ytop] != room_map.map_[xtop + 1][ytop]:
             return True
         if xbot == 0 or room_map.map_[xbot][ybot] != room_map.map_[xbot - 1][ybot]:
             return True
-        if xbot == map_width - 1 or room_map.map_[xbot][ybot] != room_map.map_[xbot + 1][ybot]:
+        if xbot == room_map.width - 1 or room_map.map_[xbot][ybot] != room_map.map_[xbot + 1][ybot]:
             return True
         return False
 
@@ -110,11 +119,11 @@ class HotlineSerializer:
     def is_vertical_corner(room_map, xtop, ytop, xbot, ybot):
         if ytop == 0 or room_map.map_[xtop][ytop] != room_map.map_[xtop][ytop - 1]:
             return True
-        if ytop == map_height - 1 or room_map.map_[xtop][ytop] != room_map.map_[xtop][ytop + 1]:
+        if ytop == room_map.height - 1 or room_map.map_[xtop][ytop] != room_map.map_[xtop][ytop + 1]:
             return True
         if ybot == 0 or room_map.map_[xbot][ybot] != room_map.map_[xbot][ybot - 1]:
             return True
-        if ybot == map_height - 1 or room_map.map_[xbot][ybot] != room_map.map_[xbot][ybot + 1]:
+        if ybot == room_map.height - 1 or room_map.map_[xbot][ybot] != room_map.map_[xbot][ybot + 1]:
             return True
         return False
 
@@ -128,107 +137,103 @@ class WallSerializer:
                  "Door": (25, 26)}
 
     @staticmethod
-    def serialize(map_, path):
-        with open(path, "w") as f:
-            for x in range(map_width):
-                for y in range(map_height):
-                    if "HorizontalWall" in map_[x][y]:
-                        WallSerializer.write(f, map_[x][y]["HorizontalWall"], x, y)
-                    if "VerticalWall" in map_[x][y]:
-                        WallSerializer.write(f, map_[x][y]["VerticalWall"], x, y)
+    def serialize(walls, path):
+        out = []
+        for x, y, kind, orientation in walls.walls():
+            WallSerializer.write(out, (kind, orientation), x, y)
+        write_output(path, out)
 
     @staticmethod
-    def write(f, wall, x, y):
+    def write(out, wall, x, y):
         if wall[0] == "Transition":
             return
-        print(WallSerializer.objectKey[wall[0]][wall[1]], file=f)
-        print(32 * x, file=f)
-        print(32 * y, file=f)
-        print(WallSerializer.spriteKey[wall[0]][wall[1]], file=f)
-        print(0, file=f)
+        out.append("%d\n%d\n%d\n%d\n0\n" % (WallSerializer.objectKey[wall[0]][wall[1]], 32 * x, 32 * y,
+                                              WallSerializer.spriteKey[wall[0]][wall[1]]))
 
 
 class TileSerializer:
-    floor_tiles = []
-    rug_tiles = []
-    kitchen_tiles = []
-    bathroom_tiles = []
+    # The sprite sheet cells of every room type, built on first use so importing the serializers stays cheap
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def room_type_tiles():
+        floor_tiles = []
+        rug_tiles = []
+        kitchen_tiles = []
+        bathroom_tiles = []
 
-    for i in range(12):
-        for j in range(11):
-            floor_tiles.append({
-                "ObjectKey": 2,
-                "Column": i * 16,
-                "Row": j * 16,
-            })
+        for i in range(12):
+            for j in range(11):
+                floor_tiles.append({
+                    "ObjectKey": 2,
+                    "Column": i * 16,
+                    "Row": j * 16,
+                })
 
-    for i in range(10):
-        for j in range(8):
-            bathroom_tiles.append({
-                "ObjectKey": 5,
-                "Column": i * 16,
-                "Row": j * 16,
-            })
+        for i in range(10):
+            for j in range(8):
+                bathroom_tiles.append({
+                    "ObjectKey": 5,
+                    "Column": i * 16,
+                    "Row": j * 16,
+                })
 
-    for i in range(12):
-        for j in range(10):
-            if j == 9 and i < 6:
-                continue
-            rug_tiles.append({
-                "ObjectKey": 6,
-                "Column": i * 16,
-                "Row": j * 16,
-            })
+        for i in range(12):
+            for j in range(10):
+                if j == 9 and i < 6:
+                    continue
+                rug_tiles.append({
+                    "ObjectKey": 6,
+                    "Column": i * 16,
+                    "Row": j * 16,
+                })
 
-    for i in range(7):
-        for j in range(11):
-            if j == 10 and i < 2:
-                continue
-            kitchen_tiles.append({
-                "ObjectKey": 7,
-                "Column": i * 16,
-                "Row": j * 16,
-            })
+        for i in range(7):
+            for j in range(11):
+                if j == 10 and i < 2:
+                    continue
+                kitchen_tiles.append({
+                    "ObjectKey": 7,
+                    "Column": i * 16,
+                    "Row": j * 16,
+                })
 
-    room_type_tiles = {
-        "Storage": floor_tiles,
-        "Corridor": rug_tiles,
-        "Hall": floor_tiles,
-        "Kitchen": kitchen_tiles,
-        "Bathroom": bathroom_tiles
-    }
+        return {
+            "Storage": floor_tiles,
+            "Corridor": rug_tiles,
+            "Hall": floor_tiles,
+            "Kitchen": kitchen_tiles,
+            "Bathroom": bathroom_tiles
+        }
 
     @staticmethod
-    def write(f, tile, x, y):
-        TileSerializer.write_tile(f, tile, x * 32, y * 32)
-        TileSerializer.write_tile(f, tile, x * 32 + 16, y * 32)
-        TileSerializer.write_tile(f, tile, x * 32, y * 32 + 16)
-        TileSerializer.write_tile(f, tile, x * 32 + 16, y * 32 + 16)
+    def write(out, tile, x, y):
+        TileSerializer.write_tile(out, tile, x * 32, y * 32)
+        TileSerializer.write_tile(out, tile, x * 32 + 16, y * 32)
+        TileSerializer.write_tile(out, tile, x * 32, y * 32 + 16)
+        TileSerializer.write_tile(out, tile, x * 32 + 16, y * 32 + 16)
 
     @staticmethod
-    def write_tile(f, tile, x, y):
-        print(tile["ObjectKey"], file=f)
-        print(tile["Column"], file=f)
-        print(tile["Row"], file=f)
-        print(x, file=f)
-        print(y, file=f)
-        print("1001", file=f)
+    def write_tile(out, tile, x, y):
+        out.append("%d\n%d\n%d\n%d\n%d\n1001\n" % (tile["ObjectKey"], tile["Column"], tile["Row"], x, y))
 
     @staticmethod
-    def serialize(gene, path, _rng):
-        rooms_tiles = RoomMap([rtc.room for rtc in gene]).get_rooms_tiles()
-        with open(path, "w") as f:
-            for chromosome in gene:
-                if chromosome.room.index not in rooms_tiles:
-                    continue
-                tile = _rng.choice(TileSerializer.room_type_tiles[chromosome.room_type])
-                for point in rooms_tiles[chromosome.room.index]:
-                    TileSerializer.write(f, tile, point.x, point.y)
+    def serialize(gene, path, _rng, layout=None, config=default_config):
+        rooms_tiles = (layout or LayoutAnalysis([rtc.room for rtc in gene], config=config)).rooms_tiles
+        out = []
+        for chromosome in gene:
+            if chromosome.room.index not in rooms_tiles:
+                continue
+            tile = _rng.choice(TileSerializer.room_type_tiles()[chromosome.room_type])
+            for point in rooms_tiles[chromosome.room.index]:
+                TileSerializer.write(out, tile, point.x, point.y)
+        write_output(path, out)
 
 
 class EnemySerializer:
+    # The .obj file holds the furniture too, objects are the lines FurnitureGenerator.place_objects collected.
+    # Both are written with one call
     @staticmethod
-    def serialize(gene, path):
+    def serialize(gene, path, objects=()):
         enemy_types = {
             "fat": (2194, 1289),
             "dog": (1766, 1064),
@@ -247,21 +252,16 @@ class EnemySerializer:
             "shotgun_random": (206, 183)
         }
         enemy_tiles = []
-        with open(path, "a") as f:
-            # Place the fans car at the lower right corner of the map
-            f.write("1583\n933\n712\n392\n0\n236\n0\n")
-            for chromosome in gene:
-                for enemy in chromosome.enemies:
-                    enemy_tiles.append(enemy[0])
-                    EnemySerializer.write(f, enemy_types[enemy[1]], enemy[0].x, enemy[0].y)
+        out = list(objects)
+        # Place the fans car at the lower right corner of the map
+        out.append("1583\n933\n712\n392\n0\n236\n0\n")
+        for chromosome in gene:
+            for enemy in chromosome.enemies:
+                enemy_tiles.append(enemy[0])
+                EnemySerializer.write(out, enemy_types[enemy[1]], enemy[0].x, enemy[0].y)
+        write_output(path, out)
         return enemy_tiles
 
     @staticmethod
-    def write(f, enemy_type, x, y):
-        print(10, file=f)
-        print(32 * x + 16, file=f)
-        print(32 * y + 16, file=f)
-        print(enemy_type[0], file=f)
-        print(270, file=f)
-        print(enemy_type[1], file=f)
-        print(0, file=f)
+    def write(out, enemy_type, x, y):
+        out.append("10\n%d\n%d\n%d\n270\n%d\n0\n" % (32 * x + 16, 32 * y + 16, enemy_type[0], enemy_type[1]))
@@ -0,0 +1,83 @@
+import cProfile
+import json
+import os
+import time
+from contextlib import contextmanager, nullcontext
+
+from config import *
+
+
+# Instrumentation of a level's generation: timers around the stages, counters and per-generation fitness of
+# the GAs, streamed as JSON lines to path, and with profile_folder a cProfile dump of every stage. Every
+# record carries the context, e.g. the seed
+class Telemetry:
+    def __init__(self, path=None, profile_folder=None, **context):
+        self.file = None if path is None else open(path, "a")
+        self.profile_folder = profile_folder
+        self.context = context
+        if profile_folder is not None:
+            os.makedirs(profile_folder, exist_ok=True)
+
+    # one line per record, written at once so processes can share the file
+    def record(self, kind, **values):
+        if self.file is None:
+            return
+        self.file.write(json.dumps(dict(self.context, kind=kind, time=time.time(), **values)) + "\n")
+        self.file.flush()
+
+    # Wall-clock and CPU time of the block
+    @contextmanager
+    def stage(self, name):
+        profile = None if self.profile_folder is None else cProfile.Profile()
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+                names = [str(value) for value in self.context.values()] + [name]
+                profile.dump_stats(os.path.join(self.profile_folder, "_".join(names) + ".prof"))
+            self.record("stage", stage=name, wall=time.perf_counter() - wall, cpu=time.process_time() - cpu)
+
+    # Records the best and mean fitness and the rejected (-1000) individuals of every generation, and the
+    # evaluations and cache use of the GA when it finishes
+    def watch(self, ga, name):
+        def generation(number, steps, population):
+            values = [fitness for _, fitness in population]
+            self.record("generation", stage=name, generation=number, best=values[0],
+                        mean=sum(values) / len(values), rejected=values.count(-1000))
+            if number == steps:
+                cache = getattr(ga, "cache", None)
+                self.record("ga", stage=name, generations=ga.generations, evaluations=ga.evaluations,
+                            cache_hits=None if cache is None else cache.hits,
+                            cache_misses=None if cache is None else cache.misses)
+
+        ga.observe(generation)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+# Stands in for Telemetry when it is off, so the instrumented code costs a method call per stage
+class NullTelemetry:
+    def record(self, kind, **values):
+        pass
+
+    def stage(self, name):
+        return nullcontext()
+
+    def watch(self, ga, name):
+        pass
+
+    def close(self):
+        pass
+
+
+# Telemetry configured by the config's telemetry_path and profile_folder
+def open_telemetry(config=default_config, **context):
+    if config.telemetry_path is None and config.profile_folder is None:
+        return NullTelemetry()
+    return Telemetry(config.telemetry_path, config.profile_folder, **context)
@@ -1,12 +1,16 @@
 import tkinter as tk
 
-from Room import RoomsGraph, RoomMap
-from config import *
+from Geometry import Point
+from Layout import LayoutAnalysis
+from config import default_config
 
 
+# Draws layouts analysed with config, the level's config when the level is shown
 class Application(tk.Frame):
-    def __init__(self, master=None):
+    def __init__(self, master=None, config=default_config):
         super().__init__(master)
+        # not self.config, which is tkinter's configure
+        self.level_config = config
 
         self.WIDTH = 680
         self.HEIGHT = 480
@@ -40,25 +44,24 @@ class Application(tk.Frame):
         for rc in placed_over:
             self.draw_rect(rc.rect, colors[rc.index % 10])
 
-    def draw_indexes(self, room_map):
-        for x in range(map_width):
-            for y in range(map_height):
-                tile = room_map.map_[x][y]
+    def draw_indexes(self, layout):
+        for x in range(layout.room_map.width):
+            for y in range(layout.room_map.height):
+                tile = layout.room_map.map_[x][y]
                 if tile != -1:
                     self.draw_index(x, y, tile)
-        point_lists = [room_map.get_holes(),
-                       room_map.get_narrow_corridors(),
-                       room_map.get_tiny_corridors()]
+        point_lists = [layout.holes,
+                       layout.narrow_corridors,
+                       layout.tiny_corridors]
         for j in range(len(point_lists)):
             for point in point_lists[j]:
                 self.draw_index(point.x, point.y, '*' + str(j), "red")
 
-    def draw_graph(self, room_map, gene):
-        graph = RoomsGraph(gene)
-        rooms_centers = room_map.get_rooms_centers()
-        for room, center in rooms_centers.items():
-            rooms_centers[room].x = center.x * self.width_step + self.OFFSET
-            rooms_centers[room].y = center.y * self.height_step + self.OFFSET
+    def draw_graph(self, layout):
+        graph = layout.graph
+        rooms_centers = {room: Point(center.x * self.width_step + self.OFFSET,
+                                     center.y * self.height_step + self.OFFSET)
+                         for room, center in layout.rooms_centers.items()}
         for room, center in rooms_centers.items():
             x = center.x
             y = center.y
@@ -71,13 +74,13 @@ class Application(tk.Frame):
                 p2 = rooms_centers[to_room]
                 self.w.create_line(p1.x, p1.y, p2.x, p2.y, width=2)
 
-    def draw(self, gene):
+    def draw(self, gene, layout=None):
         self.w.delete("all")
-        room_map = RoomMap(gene)
-        self.draw_rooms(room_map)
+        layout = layout or LayoutAnalysis(gene, config=self.level_config)
+        self.draw_rooms(layout.room_map)
         self.draw_grid()
-        # self.draw_indexes(room_map)
-        self.draw_graph(room_map, gene)
+        # self.draw_indexes(layout)
+        self.draw_graph(layout)
 
     def draw_index(self, x, y, index, fill="black"):
         self.w.create_text(self.normalize((x, y)), text=index, fill=fill)
@@ -110,3 +113,24 @@ class Application(tk.Frame):
             y_offset = width / 2 * (rotation == 1)
         return (coords[0] * self.width_step + self.OFFSET + x_offset,
                 coords[1] * self.height_step + self.OFFSET + y_offset)
+
+
+# GeneticAlgorithm observer drawing the best gene of the reported generations, the window is opened on the
+# first call so the GA itself never needs a display
+class ProgressWindow:
+    def __init__(self, config=default_config):
+        self.config = config
+        self.app = None
+
+    def __call__(self, generation, steps, population):
+        if self.app is None:
+            self.app = Application(master=tk.Tk(), config=self.config)
+        self.app.draw(population[0][0])
+        self.app.update()
+        if generation == steps:
+            self.close()
+
+    def close(self):
+        if self.app is not None:
+            self.app.master.destroy()
+            self.app = None
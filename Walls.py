@@ -0,0 +1,138 @@
+from array import array
+
+from Room import ArrayRoomMap, board_masks, mask_bits
+
+
+# The walls of a level as two layers of wall kind codes, one array('b') per orientation: 0 the vertical walls
+# on the left side of the tiles, 1 the horizontal walls on their top side. Tile (x, y) is at x * height + y
+# like in the room maps. walls[x][y] is a view of a tile with the {"HorizontalWall": (kind, 1),
+# "VerticalWall": (kind, 0)} interface of the old grid of dicts
+class WallMap:
+    kinds = (None, "Standard", "RedBrick", "Door", "Transition")
+    codes = {kind: code for code, kind in enumerate(kinds)}
+    keys = ("VerticalWall", "HorizontalWall")
+    # codes of the walls the player walks through
+    passages = (codes["Door"], codes["Transition"])
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.layers = (array("b", bytes(width * height)), array("b", bytes(width * height)))
+        self.near_door = None
+
+    # Standard walls between rooms and red brick walls between a room and the outside, from one pass of mask
+    # shifts over the room map: a tile gets a wall on a side when its neighbour there is in another room
+    @staticmethod
+    def from_room_map(room_map):
+        walls = WallMap(room_map.width, room_map.height)
+        height = walls.height
+        board = (1 << (walls.width * height)) - 1
+        top_row = board_masks(walls.width, height)[0]
+        masks, occupied = WallMap.room_masks(room_map)
+        for orientation, shift, cut in ((0, height, 0), (1, 1, top_row)):
+            edges = 0
+            for mask in masks:
+                edges |= (mask ^ (mask << shift & ~cut)) & board
+            red_brick = (occupied ^ (occupied << shift & ~cut)) & board
+            layer = walls.layers[orientation]
+            for i in mask_bits(edges & ~red_brick):
+                layer[i] = WallMap.codes["Standard"]
+            for i in mask_bits(red_brick):
+                layer[i] = WallMap.codes["RedBrick"]
+        return walls
+
+    # (room masks, occupied mask) of a room map, the engines without masks are read from their map_
+    @staticmethod
+    def room_masks(room_map):
+        if isinstance(room_map, ArrayRoomMap):
+            return list(room_map.masks.values()), room_map.occupied
+        masks = {}
+        for x, column in enumerate(room_map.map_):
+            for y, room in enumerate(column):
+                if room != -1:
+                    masks[room] = masks.get(room, 0) | 1 << (x * room_map.height + y)
+        occupied = 0
+        for mask in masks.values():
+            occupied |= mask
+        return list(masks.values()), occupied
+
+    def get(self, x, y, orientation):
+        return WallMap.kinds[self.layers[orientation][x * self.height + y]]
+
+    def set(self, x, y, orientation, kind):
+        self.layers[orientation][x * self.height + y] = WallMap.codes[kind]
+        self.near_door = None
+
+    # The tiles with a door or a transition on them or on one of their 8 neighbours, as a bytearray indexed
+    # like the layers. The passages are dilated with mask shifts once and kept until a wall changes, so the
+    # furniture and enemy placement rules look tiles up in O(1)
+    def near_door_mask(self):
+        if self.near_door is None:
+            height = self.height
+            board = (1 << (self.width * height)) - 1
+            top_row, bottom_row, _, _ = board_masks(self.width, height)
+            passages = 0
+            for layer in self.layers:
+                for i, code in enumerate(layer):
+                    if code in WallMap.passages:
+                        passages |= 1 << i
+            near = passages | passages << height | passages >> height
+            near = (near | (near << 1 & ~top_row) | (near >> 1 & ~bottom_row)) & board
+            self.near_door = bytearray(self.width * height)
+            for i in mask_bits(near):
+                self.near_door[i] = 1
+        return self.near_door
+
+    def is_near_door(self, tile):
+        return self.near_door_mask()[tile[0] * self.height + tile[1]] == 1
+
+    # (x, y, kind, orientation) of every wall in tile order, the horizontal wall of a tile first
+    def walls(self):
+        height = self.height
+        for i, (vertical, horizontal) in enumerate(zip(*self.layers)):
+            if horizontal:
+                yield i // height, i % height, WallMap.kinds[horizontal], 1
+            if vertical:
+                yield i // height, i % height, WallMap.kinds[vertical], 0
+
+    def __len__(self):
+        return self.width
+
+    def __getitem__(self, x):
+        return WallColumn(self, x)
+
+
+class WallColumn:
+    def __init__(self, walls, x):
+        self.walls = walls
+        self.x = x
+
+    def __len__(self):
+        return self.walls.height
+
+    def __getitem__(self, y):
+        return WallTile(self.walls, self.x, y)
+
+
+# The walls of one tile as a dict of "HorizontalWall"/"VerticalWall" to (kind, orientation)
+class WallTile:
+    def __init__(self, walls, x, y):
+        self.walls = walls
+        self.x = x
+        self.y = y
+
+    def __contains__(self, key):
+        return self.walls.get(self.x, self.y, WallMap.keys.index(key)) is not None
+
+    def __getitem__(self, key):
+        orientation = WallMap.keys.index(key)
+        kind = self.walls.get(self.x, self.y, orientation)
+        if kind is None:
+            raise KeyError(key)
+        return kind, orientation
+
+    def __setitem__(self, key, wall):
+        self.walls.set(self.x, self.y, WallMap.keys.index(key), wall[0])
+
+    def items(self):
+        return [(key, self[key]) for key in reversed(WallMap.keys) if key in self]
@@ -0,0 +1,98 @@
+import argparse
+import json
+import os
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from queue import Queue
+from threading import Thread
+
+from LevelGenerator import generate_level, remove_checkpoints
+from Serializer import write_output
+from config import default_config
+
+
+# Generates the level of one seed in a worker process and returns (report, files by name). The files are
+# only written by the writer thread of the main process. The GAs evaluate serially, the pool already uses
+# the cores. The config travels with the task, so one pool can serve levels of different sizes
+def generate(seed, output, config=default_config):
+    path = os.path.join(output, str(seed))
+    try:
+        level = generate_level(seed, path, buffered=True, config=config)
+        return level.report(), level.files
+    except Exception:
+        return {"seed": seed, "path": path, "error": traceback.format_exc()}, {}
+
+
+# Writes the levels taken from the queue until it gets None, a failed write is reported as the level's error.
+# Every file is replaced at once, so no file is left partly written
+def write_levels(levels, reports, config):
+    while True:
+        item = levels.get()
+        if item is None:
+            return
+        report, files = item
+        started = time.perf_counter()
+        try:
+            if files:
+                os.makedirs(report["path"], exist_ok=True)
+                for name, text in files.items():
+                    write_output(os.path.join(report["path"], name), [text])
+                remove_checkpoints(report["seed"], config)
+                report["timings"]["write"] = time.perf_counter() - started
+        except OSError:
+            report["error"] = traceback.format_exc()
+        reports.append(report)
+        print("%d seed %d %s" % (len(reports), report["seed"],
+                                 "failed" if "error" in report else "%.2fs" % report["timings"]["total"]))
+
+
+# Levels stream through two stages: the GAs of queue_size + workers seeds at a time run on the pool, and a
+# writer thread writes the finished ones. When the writer falls behind the queue fills up, no new seeds are
+# submitted until it catches up, so memory stays bounded while computing and writing overlap. Writes
+# manifest.json to the output root with the report of every level (timings and fitness, or the error)
+def run(seeds, output, workers=None, queue_size=4, config=default_config):
+    os.makedirs(output, exist_ok=True)
+    started = time.perf_counter()
+    workers = workers or os.cpu_count()
+    levels, reports = Queue(queue_size), []
+    writer = Thread(target=write_levels, args=(levels, reports, config))
+    writer.start()
+    try:
+        with ProcessPoolExecutor(workers) as pool:
+            remaining = iter(seeds)
+            pending = {pool.submit(generate, seed, output, config)
+                       for seed in islice(remaining, workers + queue_size)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    levels.put(future.result())
+                    for seed in islice(remaining, 1):
+                        pending.add(pool.submit(generate, seed, output, config))
+    finally:
+        levels.put(None)
+        writer.join()
+
+    reports.sort(key=lambda report: report["seed"])
+    manifest = {"seeds": len(reports), "failed": sum("error" in report for report in reports),
+                "workers": workers, "seconds": time.perf_counter() - started, "levels": reports}
+    with open(os.path.join(output, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate levels for many seeds on all cores")
+    seeds = parser.add_mutually_exclusive_group(required=True)
+    seeds.add_argument("--seeds", nargs="+", type=int, help="list of seeds")
+    seeds.add_argument("--seed-range", nargs=2, type=int, metavar=("START", "STOP"), help="seeds START to STOP - 1")
+    parser.add_argument("--output", required=True, help="root folder, every level goes to <output>/<seed>")
+    parser.add_argument("--workers", type=int, help="worker processes, all cores by default")
+    parser.add_argument("--queue-size", type=int, default=4, help="finished levels waiting to be written")
+    parser.add_argument("--map-scale", type=float, default=1, help="map size relative to the config's")
+    args = parser.parse_args()
+
+    manifest = run(args.seeds or list(range(*args.seed_range)), args.output, args.workers, args.queue_size,
+                   default_config.scaled(args.map_scale))
+    print("%d levels, %d failed, %.2fs" % (manifest["seeds"], manifest["failed"], manifest["seconds"]))
@@ -0,0 +1,157 @@
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+from Chromosomes import RoomChromosome, RoomTypeChromosome, EnemyChromosome
+from FurnitureGenerator import FurnitureGenerator
+from GeneticAlgorithm import GeneticAlgorithm, Fitness
+from Geometry import Point
+from Layout import LayoutAnalysis, room_map_engines
+from LevelGenerator import generate_level
+from Room import RoomsGraph
+from Serializer import HotlineSerializer, TileSerializer, WallSerializer, EnemySerializer
+from config import default_config
+
+
+# Seconds per call of function over the inputs, the best of repeats runs. setup is called before every run
+def timed(function, inputs, repeats, setup=None):
+    best = float("inf")
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        for value in inputs:
+            function(value)
+        best = min(best, time.perf_counter() - started)
+    return best / len(inputs)
+
+
+# Seconds per call of the hot functions at the default map size
+def function_benchmarks(genes_number, repeats):
+    rng = random.Random(1)
+    genes = [RoomChromosome.generate_gene(rng, default_config.gene_length) for _ in range(genes_number)]
+    graphs = [room_map_engines["array"](gene).get_graph() for gene in genes]
+
+    # a connected layout to furnish and populate, from a short room GA run
+    rng = random.Random(2)
+    room_ga = GeneticAlgorithm(RoomChromosome.mutate, GeneticAlgorithm.uniform_crossover, Fitness.mixed_room_fitness,
+                               [RoomChromosome.generate_gene(rng, default_config.gene_length)
+                                for _ in range(default_config.population_size)], rng)
+    rooms = room_ga.compute(20)
+    hero = Point(*default_config.hero_position)
+    layout = LayoutAnalysis(rooms)
+    rooms_tiles = dict(layout.rooms_tiles)
+    room_types = [RoomTypeChromosome.generate_gene(rng, rooms) for _ in range(genes_number)]
+    rooms_types = {chromosome.room.index: chromosome.room_type for chromosome in room_types[0]}
+    hotline_map, start_tile = HotlineSerializer.to_map(rooms, hero, random.Random(3), layout)
+    occupied_tiles = FurnitureGenerator.place_objects(random.Random(4), hotline_map, rooms_types, rooms_tiles, [])
+    start_room = next(room for room, tiles in rooms_tiles.items() if start_tile in tiles)
+    distance_map = layout.graph.get_distance_map(start_room, layout.rooms_centers)
+    rooms_by_distance = sorted(distance_map, key=distance_map.get)
+    enemies = [EnemyChromosome.generate_gene(rng, dict(rooms_tiles), rooms_by_distance, occupied_tiles)
+               for _ in range(genes_number)]
+
+    def clear_history():
+        Fitness.histories.clear()
+
+    # ArrayRoomMap caches its narrow corridor masks and its graph, so every run gets maps that never computed them
+    def fresh_maps(engine, room_maps):
+        def setup():
+            room_maps[:] = [engine(gene) for gene in genes]
+        return setup
+
+    results = {}
+    for name, engine in room_map_engines.items():
+        room_maps = []
+        results["room_map[%s]" % name] = timed(engine, genes, repeats)
+        results["get_holes[%s]" % name] = timed(lambda room_map: room_map.get_holes(), room_maps, repeats,
+                                                fresh_maps(engine, room_maps))
+        results["get_narrow_corridors[%s]" % name] = timed(lambda room_map: room_map.get_narrow_corridors(),
+                                                           room_maps, repeats, fresh_maps(engine, room_maps))
+        results["get_graph[%s]" % name] = timed(lambda room_map: room_map.get_graph(), room_maps, repeats,
+                                                fresh_maps(engine, room_maps))
+    results["rooms_graph"] = timed(RoomsGraph, genes, repeats)
+    results["get_diameter"] = timed(lambda graph: graph.get_diameter(),
+                                    [graph for graph in graphs if graph.connected()], repeats,
+                                    lambda: [setattr(graph, "hops", None) for graph in graphs])
+    results["mixed_room_fitness"] = timed(Fitness.mixed_room_fitness, genes, repeats, clear_history)
+    results["room_type_fitness"] = timed(Fitness.room_type_fitness, room_types, repeats, clear_history)
+    results["enemy_fitness"] = timed(Fitness.enemy_fitness, enemies, repeats)
+    results["to_map"] = timed(lambda gene: HotlineSerializer.to_map(gene, hero, random.Random(3)),
+                              [rooms], repeats)
+    results["place_objects"] = timed(lambda _: FurnitureGenerator.place_objects(
+        random.Random(4), hotline_map, rooms_types, rooms_tiles, []), [None], repeats)
+    results["wall_serializer"] = timed(lambda _: WallSerializer.serialize(hotline_map, io.StringIO()), [None],
+                                       repeats)
+    results["tile_serializer"] = timed(lambda gene: TileSerializer.serialize(gene, io.StringIO(), random.Random(5)),
+                                       room_types[:10], repeats)
+    results["enemy_serializer"] = timed(lambda gene: EnemySerializer.serialize(gene, io.StringIO()), enemies,
+                                        repeats)
+    return results
+
+
+# Mean seconds of a whole level over the seeds, files are kept in memory
+def level_benchmark(seeds, config=default_config):
+    started = time.perf_counter()
+    for seed in seeds:
+        generate_level(seed, "", buffered=True, config=config)
+    return (time.perf_counter() - started) / len(seeds)
+
+
+# Results of this benchmark with the default arguments, committed so every run is checked against them
+baseline_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+
+# Benchmarks that got slower than the baseline by more than tolerance, as (name, baseline, result)
+def regressions(results, baseline, tolerance):
+    return [(name, baseline[name], seconds) for name, seconds in results.items()
+            if name in baseline and seconds > baseline[name] * (1 + tolerance)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time the hot functions and whole levels on fixed seeds")
+    parser.add_argument("--seeds", nargs="+", type=int, default=[1, 2, 3], help="seeds of the level benchmarks")
+    parser.add_argument("--scales", nargs="*", type=float, default=[2], help="larger map sizes to time levels at")
+    parser.add_argument("--genes", type=int, default=200, help="inputs of the function benchmarks")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--levels-only", action="store_true")
+    parser.add_argument("--runs", type=int, default=3,
+                        help="keep the median result of this many runs, so one noisy run does not decide it")
+    parser.add_argument("--output", help="write the results to this file instead of stdout")
+    parser.add_argument("--baseline", default=baseline_path,
+                        help="results file to compare with, fails on regressions. An empty value skips the check")
+    parser.add_argument("--tolerance", type=float, default=0.6, help="allowed slowdown against the baseline")
+    args = parser.parse_args()
+
+    runs = []
+    for _ in range(args.runs):
+        run = {}
+        if not args.levels_only:
+            run.update(function_benchmarks(args.genes, args.repeats))
+        run["level[x1]"] = level_benchmark(args.seeds)
+        for scale in args.scales:
+            run["level[x%g]" % scale] = level_benchmark(args.seeds, default_config.scaled(scale))
+        runs.append(run)
+    results = {name: statistics.median(run[name] for run in runs) for name in runs[0]}
+
+    report = json.dumps({"python": platform.python_version(), "machine": platform.machine(), "seeds": args.seeds,
+                         "results": results}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    else:
+        print(report)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = regressions(results, json.load(f)["results"], args.tolerance)
+        for name, before, after in slower:
+            print("%s regressed: %.6fs -> %.6fs" % (name, before, after), file=sys.stderr)
+        if slower:
+            exit(1)
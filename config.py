@@ -1,23 +1,97 @@
+import hashlib
 import os
 
-map_width = 32
-map_height = 21
-min_room_size = 3
-max_room_size = 10
-average_room_area = (min_room_size * min_room_size + max_room_size * max_room_size) // 2
-#32590456
-seed = 98779837
-random_seed = False
-debug_output = False
-gene_length = 10
-population_size = 20
-iterations = 100
-difficulty = 60
+
+# The tunables of a level. A Config is passed to the room maps, chromosomes, fitness functions, serializers
+# and generate_level, so one process can make levels of different sizes. Config(map_width=64) is the
+# defaults with the given values changed
+class Config:
+    # values that change how a run is done or reported but not the genes it produces
+    run_settings = ("debug_output", "draw_progress", "progress_every", "progress_interval", "executor", "workers",
+                    "checkpoint_folder", "checkpoint_interval", "telemetry_path", "profile_folder",
+                    "fitness_cache_size")
+
+    def __init__(self, **values):
+        self.map_width = 32
+        self.map_height = 21
+        self.min_room_size = 3
+        self.max_room_size = 10
+        #32590456
+        self.seed = 98779837
+        self.random_seed = False
+        self.debug_output = False
+        # draw the room GA's best gene while it runs, at most every progress_every generations and
+        # progress_interval ms
+        self.draw_progress = False
+        self.progress_every = 1
+        self.progress_interval = 100
+        self.gene_length = 10
+        self.population_size = 20
+        self.iterations = 100
+        # seconds to generate a level in, None runs all iterations of every GA. With a budget the room, room
+        # type and enemy GAs get stage_shares of the time left when they start, and stop after plateau_window
+        # generations without improvement
+        self.time_budget = None
+        self.stage_shares = (3, 1, 1)
+        self.plateau_window = 25
+        self.difficulty = 60
+        # False keeps enemies off the tiles next to doors and transitions
+        self.enemies_near_doors = True
+        # where the player comes from, the level's entrance is the room wall closest to it
+        self.hero_position = (20, 25)
+        # how a generation's fitness is evaluated: "serial", "thread" or "process", workers=None uses all cores
+        self.executor = "serial"
+        self.workers = None
+        # how parents are picked and individuals replaced: "best_pair", "tournament", "rank", "mu_plus_lambda"
+        # or "steady_state", see Selection.py
+        self.selection_strategy = "best_pair"
+        self.tournament_size = 3
+        self.elites_number = 2
+        self.steady_state_children = 2
+        # room GA islands (1 runs a single population), generations between migrations and migrants per island
+        self.islands_number = 1
+        self.migration_interval = 10
+        self.migrants_number = 1
+        # folder for the GAs' checkpoints, None disables them. main.py resumes the stages it finds checkpoints
+        # of and removes them once the level is saved
+        self.checkpoint_folder = None
+        self.checkpoint_interval = 5
+        # JSON lines file for stage timers, GA counters and per-generation fitness, and a folder for a cProfile
+        # dump of every stage. None turns them off
+        self.telemetry_path = None
+        self.profile_folder = None
+        # number of fitness values remembered by a FitnessCache
+        self.fitness_cache_size = 1024
+        # how room layouts are evaluated: "list" (RoomMap), "array" (ArrayRoomMap, bitmasks)
+        # or "rect" (RectRoomMap, from the rooms' rectangles, for large maps)
+        self.room_map_engine = "array"
+        for name, value in values.items():
+            if name not in self.__dict__:
+                raise TypeError("unknown config value %r" % name)
+            setattr(self, name, value)
+
+    @property
+    def average_room_area(self):
+        return (self.min_room_size * self.min_room_size + self.max_room_size * self.max_room_size) // 2
+
+    # A short hash of every value that changes the genes, checkpoints of other configs are not resumed
+    def fingerprint(self):
+        values = sorted((name, value) for name, value in self.__dict__.items() if name not in self.run_settings)
+        return hashlib.sha1(repr(values).encode()).hexdigest()[:12]
+
+    # a copy with the given values changed
+    def replace(self, **values):
+        return Config(**dict(self.__dict__, **values))
+
+    # A copy for a map scale times larger, the hero keeps its place relative to the map
+    def scaled(self, scale):
+        return self.replace(map_width=int(self.map_width * scale), map_height=int(self.map_height * scale),
+                            hero_position=tuple(int(value * scale) for value in self.hero_position))
+
+
+default_config = Config()
 
 level_folder = "a6514ac2-73e2-4c3e-b687-0ac43781cc62"
-hl2_path = os.path.join('C:\\', 'Users', os.getlogin(), 'Documents', 'My Games', "HotlineMiami2")
+# the home folder, so importing the config does not depend on a login session
+hl2_path = os.path.join(os.path.expanduser("~"), 'Documents', 'My Games', "HotlineMiami2")
 level_path = os.path.join(hl2_path, 'Levels', 'single', level_folder)
-
-walls_path = os.path.join(level_path, "level0.wll")
-tiles_path = os.path.join(level_path, "level0.tls")
-objects_path = os.path.join(level_path, "level0.obj")
@@ -0,0 +1,70 @@
+import argparse
+import json
+import random
+import time
+from functools import partial
+
+from Chromosomes import RoomChromosome
+from GeneticAlgorithm import GeneticAlgorithm, Fitness
+from Selection import strategies
+from config import default_config
+
+
+# Runs the room GA with the strategy until the best fitness reaches target, at most max_generations
+# generations and time_limit seconds, and returns (reached, fitness evaluations, seconds, best fitness)
+def run(strategy, seed, target, max_generations, time_limit, config=default_config):
+    rng = random.Random(seed)
+    ga = GeneticAlgorithm(
+        breeder=GeneticAlgorithm.uniform_crossover,
+        mutator=partial(RoomChromosome.mutate, config=config),
+        initial=[RoomChromosome.generate_gene(rng, config.gene_length, config) for _ in range(config.population_size)],
+        fitness=partial(Fitness.mixed_room_fitness, config=config),
+        _rng=rng,
+        strategy=strategies[strategy](config),
+        config=config
+    )
+    started = time.perf_counter()
+    best = ga.compute(max_generations, time.monotonic() + time_limit, target=target)
+    seconds = time.perf_counter() - started
+    fitness = Fitness.mixed_room_fitness(best, config)
+    return fitness >= target, ga.evaluations, seconds, fitness
+
+
+# Evaluations and seconds every strategy needs to reach the target fitness on the same seeds. Means are over
+# the runs that reached it
+def benchmark(names, seeds, target, max_generations, time_limit, config=default_config):
+    report = {}
+    for name in names:
+        runs = [run(name, seed, target, max_generations, time_limit, config) for seed in seeds]
+        reached = [r for r in runs if r[0]]
+        report[name] = {
+            "reached": len(reached),
+            "runs": len(runs),
+            "evaluations": sum(r[1] for r in reached) / len(reached) if reached else None,
+            "seconds": sum(r[2] for r in reached) / len(reached) if reached else None,
+            "best_fitness": sum(r[3] for r in runs) / len(runs)
+        }
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Evaluations-to-target of the room GA's selection strategies")
+    parser.add_argument("--strategies", nargs="+", default=list(strategies), choices=list(strategies))
+    parser.add_argument("--seeds", nargs="+", type=int, default=[1, 2, 3, 4, 5])
+    parser.add_argument("--target", type=float, default=20)
+    parser.add_argument("--max-generations", type=int, default=1000)
+    parser.add_argument("--time-limit", type=float, default=10, help="seconds per run")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = benchmark(args.strategies, args.seeds, args.target, args.max_generations, args.time_limit)
+    print("%-16s %8s %12s %9s %8s" % ("strategy", "reached", "evaluations", "seconds", "fitness"))
+    for name, row in report.items():
+        print("%-16s %4d/%-3d %12s %9s %8.2f" % (
+            name, row["reached"], row["runs"],
+            "-" if row["evaluations"] is None else "%.0f" % row["evaluations"],
+            "-" if row["seconds"] is None else "%.2f" % row["seconds"],
+            row["best_fitness"]))
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({"target": args.target, "seeds": args.seeds, "strategies": report}, file, indent=2)
@@ -0,0 +1,100 @@
+import random
+
+import pytest
+
+from Chromosomes import RoomChromosome, RoomTypeChromosome, EnemyChromosome
+from CompactChromosomes import CompactRoomGene, CompactRoomTypeGene, CompactEnemyGene
+from GeneticAlgorithm import GeneticAlgorithm, Fitness
+from Layout import LayoutAnalysis
+from config import default_config
+
+crossovers = ["uniform_crossover", "one_point_crossover"]
+
+
+# Keys of the population of every generation of a seeded GA run, the compact genes are decoded first
+def run(seed, mutator, breeder, fitness, initial, key, generations=15):
+    rng = random.Random(seed)
+    ga = GeneticAlgorithm(mutator, breeder, fitness, initial(rng), rng)
+    history = []
+    ga.observe(lambda generation, steps, population: history.append([key(gene) for gene, _ in population]))
+    ga.compute(generations)
+    return history
+
+
+def rooms(seed):
+    return RoomChromosome.generate_gene(random.Random(seed), default_config.gene_length)
+
+
+# the tiles of a layout with a few rooms, so the enemy genes have several chromosomes
+def rooms_tiles(seed):
+    rng = random.Random(seed)
+    while True:
+        tiles = LayoutAnalysis(RoomChromosome.generate_gene(rng, default_config.gene_length)).rooms_tiles
+        if len(tiles) >= 4:
+            return tiles
+
+
+@pytest.mark.parametrize("crossover", crossovers)
+@pytest.mark.parametrize("seed", range(3))
+def test_compact_room_run(seed, crossover):
+    objects = run(seed, RoomChromosome.mutate, getattr(GeneticAlgorithm, crossover), Fitness.mixed_room_fitness,
+                  lambda rng: [RoomChromosome.generate_gene(rng, default_config.gene_length) for _ in range(8)],
+                  RoomChromosome.gene_key)
+    compact = run(seed, CompactRoomGene.mutate, getattr(CompactRoomGene, crossover),
+                  lambda gene: Fitness.mixed_room_fitness(CompactRoomGene.decode(gene)),
+                  lambda rng: [CompactRoomGene.generate_gene(rng, default_config.gene_length) for _ in range(8)],
+                  lambda gene: RoomChromosome.gene_key(CompactRoomGene.decode(gene)))
+    assert compact == objects
+
+
+@pytest.mark.parametrize("crossover", crossovers)
+@pytest.mark.parametrize("seed", range(3))
+def test_compact_room_type_run(seed, crossover):
+    gene = rooms(seed)
+    objects = run(seed, RoomTypeChromosome.mutate, getattr(GeneticAlgorithm, crossover), Fitness.room_type_fitness,
+                  lambda rng: [RoomTypeChromosome.generate_gene(rng, gene) for _ in range(8)],
+                  RoomTypeChromosome.gene_key)
+    compact = run(seed, CompactRoomTypeGene.mutate, getattr(CompactRoomTypeGene, crossover),
+                  lambda compact_gene: Fitness.room_type_fitness(CompactRoomTypeGene.decode(compact_gene, gene)),
+                  lambda rng: [CompactRoomTypeGene.generate_gene(rng, gene) for _ in range(8)],
+                  lambda compact_gene: RoomTypeChromosome.gene_key(CompactRoomTypeGene.decode(compact_gene, gene)))
+    assert compact == objects
+
+
+@pytest.mark.parametrize("crossover", crossovers)
+@pytest.mark.parametrize("seed", range(3))
+def test_compact_enemy_run(seed, crossover):
+    tiles = rooms_tiles(seed)
+    rooms_by_distance = sorted(tiles, reverse=True)
+    occupied = [tile for room_tiles in tiles.values() for tile in room_tiles[::7]]
+    objects = run(seed, EnemyChromosome.mutate, getattr(GeneticAlgorithm, crossover), Fitness.enemy_fitness,
+                  lambda rng: [EnemyChromosome.generate_gene(rng, dict(tiles), rooms_by_distance, occupied)
+                               for _ in range(8)],
+                  EnemyChromosome.gene_key)
+    codec = CompactEnemyGene.for_rooms(dict(tiles), rooms_by_distance, occupied)
+    compact = run(seed, codec.mutate, getattr(CompactEnemyGene, crossover),
+                  lambda gene: Fitness.enemy_fitness(codec.decode(gene)),
+                  lambda rng: [codec.generate_gene(rng) for _ in range(8)],
+                  lambda gene: EnemyChromosome.gene_key(codec.decode(gene)))
+    assert compact == objects
+
+
+def test_round_trips():
+    gene = rooms(0)
+    assert RoomChromosome.gene_key(CompactRoomGene.decode(CompactRoomGene.encode(gene))) == \
+        RoomChromosome.gene_key(gene)
+    types = RoomTypeChromosome.generate_gene(random.Random(0), gene)
+    assert RoomTypeChromosome.gene_key(CompactRoomTypeGene.decode(CompactRoomTypeGene.encode(types), gene)) == \
+        RoomTypeChromosome.gene_key(types)
+    tiles = rooms_tiles(0)
+    enemies = EnemyChromosome.generate_gene(random.Random(0), dict(tiles), list(tiles), [])
+    codec = CompactEnemyGene.of(enemies)
+    assert EnemyChromosome.gene_key(codec.decode(CompactEnemyGene.encode(enemies))) == \
+        EnemyChromosome.gene_key(enemies)
+
+
+def test_room_gene_limit():
+    rng = random.Random(0)
+    CompactRoomGene.encode(RoomChromosome.generate_gene(rng, CompactRoomGene.max_rooms))
+    with pytest.raises(ValueError, match="at most 63 rooms"):
+        CompactRoomGene.encode(RoomChromosome.generate_gene(rng, CompactRoomGene.max_rooms + 1))
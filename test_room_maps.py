@@ -0,0 +1,79 @@
+import random
+
+import pytest
+
+from Chromosomes import RoomChromosome
+from GeneticAlgorithm import GeneticAlgorithm
+from Room import RoomMap, ArrayRoomMap, RoomMapHistory, RoomsGraph
+from config import default_config
+
+
+# What the fitness functions read from a room map, in a form that compares equal across engines
+def analysis(room_map):
+    tiles = room_map.get_rooms_tiles()
+    return {
+        "map": [list(column) for column in room_map.map_],
+        "rooms": [room.index for room in room_map.rooms],
+        "tiles": [(room, [(tile.x, tile.y) for tile in tiles[room]]) for room in tiles],
+        "areas": list(room_map.get_rooms_area().items()),
+        "narrow_corridors": room_map.count_narrow_corridors(),
+        "tiny_corridors": room_map.count_tiny_corridors(),
+        "holes": room_map.count_holes(),
+    }
+
+
+# the rooms and the order of the adjacency lists, which decide the order of the distance maps
+def adjacency(graph):
+    return list(graph.AdjMatrix.items())
+
+
+def assert_rebuilt(room_map, gene):
+    assert analysis(room_map) == analysis(RoomMap(gene))
+    assert adjacency(room_map.get_graph()) == adjacency(RoomsGraph(gene))
+
+
+# Children are bred and mutated like in the room GA, so they share chromosomes with their parents. Some parents
+# have their grid or graph built before the children are derived, which derive reuses
+def children(rng, parents, number):
+    genes = []
+    for _ in range(number):
+        gene1, gene2 = rng.sample(parents, 2)
+        crossover = rng.choice([GeneticAlgorithm.uniform_crossover, GeneticAlgorithm.one_point_crossover])
+        gene = crossover(rng, gene1, gene2)
+        if rng.random() < 0.8:
+            gene = RoomChromosome.mutate(rng, gene)
+        genes.append(gene)
+    return genes
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_derive_matches_rebuild(seed):
+    rng = random.Random(seed)
+    parents = [RoomChromosome.generate_gene(rng, default_config.gene_length) for _ in range(6)]
+    maps = {id(gene): ArrayRoomMap(gene) for gene in parents}
+    for generation in range(6):
+        for room_map in maps.values():
+            if rng.random() < 0.5:
+                room_map.get_graph()
+            if rng.random() < 0.5:
+                room_map.grid
+        genes = children(rng, parents, 12)
+        derived = {}
+        for gene in genes:
+            parent = rng.choice([maps[id(p)] for p in parents])
+            derived[id(gene)] = parent.derive(gene)
+            assert_rebuilt(derived[id(gene)], gene)
+        parents, maps = genes, derived
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_history_matches_rebuild(seed):
+    rng = random.Random(seed)
+    history = RoomMapHistory(10)
+    population = [RoomChromosome.generate_gene(rng, default_config.gene_length) for _ in range(8)]
+    for generation in range(10):
+        for gene in population:
+            assert_rebuilt(history.build(gene), gene)
+        population = population[:2] + children(rng, population[:4], 6)
+    assert len(history.maps) <= history.size
+    assert all(room_map in history.maps.values() for room_map in history.prefixes.values())